@@ -0,0 +1,134 @@
+import json
+
+from model import Goods, MapInfo, StepInfo, UAV
+
+# 可选的高速json后端，未安装时使用标准库json
+try:
+    import orjson as _fast_json
+except ImportError:
+    _fast_json = None
+
+
+def loads(frame):
+    """
+    解析一帧json消息
+    :param frame: 消息体，bytes/bytearray/memoryview
+    :return: 解析后的字典
+    """
+    if _fast_json is not None:
+        return _fast_json.loads(frame)
+    return json.loads(frame)
+
+
+def uav_price_table(map_info: MapInfo):
+    """型号 -> (价格, 载重, 电池容量, 充电量)"""
+    return {uav_type: (p.value, p.load_weight, p.capacity, p.charge)
+            for uav_type, p in map_info.uav_price.items()}
+
+
+class StepDecoder:
+    """
+    flyPlane每一步对战信息的专用解码器，从原始消息直接构造StepInfo，
+    无人机价格等与地图相关的信息在初始化时缓存，不再逐个无人机查表。
+    """
+
+    def __init__(self, map_info: MapInfo):
+        self.map_info = map_info
+        self._price_table = uav_price_table(map_info)
+
+    def uav(self, u):
+        """由消息中的一个无人机字典构造UAV"""
+        value, load_weight, capacity, charge = self._price_table[u['type']]
+        return UAV(u['no'], u['x'], u['y'], u['z'], u['goods_no'],
+                   u['type'], u['status'], u['remain_electricity'],
+                   value, load_weight, capacity, charge)
+
+    @staticmethod
+    def goods(g):
+        """由消息中的一个货物字典构造Goods"""
+        return Goods(g['no'], g['start_x'], g['start_y'], g['end_x'], g['end_y'],
+                     g['weight'], g['value'], g['start_time'], g['remain_time'],
+                     g['left_time'], g['status'])
+
+    def _decode_uavs(self, uav_list):
+        uav = self.uav
+        return {u['no']: uav(u) for u in uav_list}
+
+    def _decode_goods(self, goods_list):
+        goods = self.goods
+        return {g['no']: goods(g) for g in goods_list}
+
+    def decode_dict(self, data_dict):
+        """由已经解析的字典构造StepInfo，结果与StepInfo.from_dict一致"""
+        return StepInfo(
+            token=data_dict['token'],
+            notice=data_dict['notice'],
+            match_status=data_dict['match_status'],
+            time=data_dict['time'],
+            uav_we=self._decode_uavs(data_dict['UAV_we']),
+            we_value=data_dict['we_value'],
+            uav_enemy=self._decode_uavs(data_dict['UAV_enemy']),
+            enemy_value=data_dict['enemy_value'],
+            goods=self._decode_goods(data_dict['goods']))
+
+    def decode(self, frame):
+        """
+        由原始消息帧构造StepInfo
+        :param frame: 消息体，bytes/bytearray
+        :rtype: StepInfo
+        """
+        return self.decode_dict(loads(frame))
+
+
+class FlyPlaneEncoder:
+    """
+    flyPlane指令的专用序列化器。直接把每个Agent下一步的坐标、载货编号和电量写入可复用的输出缓冲区，
+    一次生成带8位长度头的完整消息帧，不再为每个无人机构造临时UAV对象和字典。
+    """
+
+    def __init__(self, token: str):
+        self._buffer = bytearray(1024 * 64)
+        self._size = 0
+        self._view = None
+        self._prefix = ('{"token":"%s","action":"flyPlane","UAV_info":[' % token).encode()
+
+    def _write(self, data):
+        # 缓冲区足够时原地覆盖，不够时切片赋值会自动扩展缓冲区
+        end = self._size + len(data)
+        self._buffer[self._size:end] = data
+        self._size = end
+
+    def encode(self, agents, purchase_uav: list):
+        """
+        生成flyPlane消息帧
+        :param agents: Agent对象序列，使用Agent.next_step作为下一步坐标
+        :param purchase_uav: [{"purchase": 'F1'}, ...]
+        :return: 指向缓冲区的memoryview，下一次encode之前有效
+        """
+        if self._view is not None:
+            # 存在导出的memoryview时缓冲区不能扩展
+            self._view.release()
+        self._size = 8  # 预留长度头
+        self._write(self._prefix)
+
+        sep = b''
+        for a in agents:
+            uav, step = a.uav, a.next_step
+            self._write(b'%s{"no":%d,"x":%d,"y":%d,"z":%d,"goods_no":%d,"remain_electricity":%d}' %
+                        (sep, uav.no, step.x, step.y, step.z, uav.goods_no, uav.remain_electricity))
+            sep = b','
+
+        self._write(b'],"purchase_UAV":[')
+        sep = b''
+        for p in purchase_uav:
+            self._write(b'%s{"purchase":"%s"}' % (sep, p['purchase'].encode()))
+            sep = b','
+        self._write(b']}')
+
+        self._buffer[0:8] = b'%08d' % (self._size - 8)
+        self._view = memoryview(self._buffer)[:self._size]
+        return self._view
+
+    def send(self, h_socket, agents, purchase_uav: list):
+        """序列化并通过一次sendall发送flyPlane消息"""
+        h_socket.sendall(self.encode(agents, purchase_uav))
@@ -1,10 +1,47 @@
 import json
 import socket
 
+# 消息头长度，消息头为8位十进制数字表示的消息体长度
+HEADER_SIZE = 8
+
+
+class FrameReader:
+    """
+    按帧读取裁判服务器消息。消息格式为：8位长度 + json消息体。
+    消息体按消息头给出的长度预先分配bytearray，通过memoryview调用recv_into原地填充，
+    避免分块拼接bytes带来的重复拷贝。
+    """
+
+    def __init__(self, sock):
+        self.socket = sock
+        self._header = bytearray(HEADER_SIZE)
+        self._header_view = memoryview(self._header)
+
+    def _recv_into(self, view):
+        """循环接收直到填满view，对端关闭连接返回False"""
+        size, rcved = len(view), 0
+        while rcved < size:
+            n = self.socket.recv_into(view[rcved:])
+            if n == 0:
+                return False
+            rcved += n
+        return True
+
+    def read_frame(self):
+        """
+        读取一帧完整的消息体
+        :return: 消息体bytearray，可以直接交给json.loads解析；连接关闭返回None
+        """
+        if not self._recv_into(self._header_view):
+            return None
+        body = bytearray(int(self._header))
+        if not self._recv_into(memoryview(body)):
+            return None
+        return body
+
 
 class Communication:
     """Socket通信类"""
-    BUFFER_SIZE = 1024
 
     def __init__(self, ip, port):
         assert isinstance(ip, str)
@@ -14,6 +51,7 @@ class Communication:
         self.ip = ip
         self.port = port
         self.receiver = None
+        self.reader = FrameReader(self.socket)
 
     def connect(self):
         self.socket.connect((self.ip, self.port))
@@ -25,26 +63,23 @@ class Communication:
         send_str = "%08d%s" % (len(msg), msg)
         return send_str.encode(encoding='ascii')
 
-    def _unpack(self, msg):
-        return msg.decode()[8:]
-
     def authorize(self, token):
         # 欢迎消息
-        welcome = self.socket.recv(self.BUFFER_SIZE)
-        if not welcome:
+        welcome = self.reader.read_frame()
+        if welcome is None:
             return False
         # 发送身份消息
         msg = '{"token": "%s","action":"sendtoken"}' % token
         self.socket.sendall(self._pack(msg))
-        auth_res = self.socket.recv(self.BUFFER_SIZE)
-        if not auth_res:
+        auth_res = self.reader.read_frame()
+        if auth_res is None:
             return False
         # 身份认证结果
-        auth_res = json.loads(self._unpack(auth_res))
+        auth_res = json.loads(auth_res)
         if auth_res and 'result' in auth_res:
             if auth_res['result'] == 1:
                 send_str = '{"token": "%s","action":"ready"}' % token
-                self.socket.sendall(send_str.encode(encoding='ascii'))
+                self.socket.sendall(self._pack(send_str))
                 return True
         return False
 
@@ -52,18 +87,24 @@ class Communication:
         """获取地图信息。发送地图信息后,表示比赛开始，该时刻为0，
         参赛者程序收到地图信息，可以移动无人机准备接送货物。此时，
         需要参赛者将他们所控制的无人机时刻为0的位置发送给服务器"""
-        map_info = self.socket.recv(self.BUFFER_SIZE)
-        if not map_info:
+        map_info = self.reader.read_frame()
+        if map_info is None:
             return None
-        map_info = json.loads(self._unpack(map_info))
-        return map_info[map_info] if 'map' in map_info else None
+        map_info = json.loads(map_info)
+        return map_info['map'] if 'map' in map_info else None
 
     def start_receive(self, recv_callback):
         while True:
-            data = self.socket.recv(self.BUFFER_SIZE)
+            data = self.reader.read_frame()
+            if data is None:
+                # 连接已被服务器关闭
+                self.socket.close()
+                return
             try:
-                ret_msg = recv_callback(self._unpack(data))
+                # 回调收到消息体(bytearray，可以直接交给json.loads)，返回已经打包好的完整消息
+                ret_msg = recv_callback(data)
                 self.socket.sendall(ret_msg)
             except StopIteration:
                 # 比赛结束，关闭连接
                 self.socket.close()
+                return
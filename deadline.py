@@ -0,0 +1,43 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """当前步的规划时间预算已用完，未完成的阶段被放弃"""
+    pass
+
+
+class Deadline:
+    """
+    每一步的规划截止时间。
+    预算从收到对战信息开始计算，需要为保底计划、序列化和发送留出余量。
+    """
+
+    def __init__(self, budget: float = 0.9):
+        """
+        :param budget: 每一步的规划时间预算(秒)
+        """
+        self.budget = budget
+        self.expire_at = float('inf')
+
+    def start(self, start_time: float = None):
+        """
+        开始计时
+        :param start_time: 计时起点(time.perf_counter)，默认为当前时间
+        """
+        if start_time is None:
+            start_time = time.perf_counter()
+        self.expire_at = start_time + self.budget
+
+    @property
+    def remaining(self):
+        """剩余时间(秒)"""
+        return self.expire_at - time.perf_counter()
+
+    @property
+    def expired(self):
+        return time.perf_counter() >= self.expire_at
+
+    def check(self):
+        """预算已用完时抛出DeadlineExceeded"""
+        if time.perf_counter() >= self.expire_at:
+            raise DeadlineExceeded()
@@ -1,5 +1,7 @@
 import queue
 
+from fleet import FleetTable
+
 
 def singleton(cls):
     instances = {}
@@ -30,6 +32,9 @@ class Env(object):
         # Agent对象字典，Key为UAV的no，Value为Agent对象
         self.agents = {}
 
+        # 己方无人机的列式状态表，行顺序与agents一致
+        self.fleet = FleetTable()
+
         # 平面坐标处于Parking的无人机
         self.uav_on_parking_xy_set = set()
 
@@ -42,5 +47,11 @@ class Env(object):
         # 有敌方无人机处于基地上空
         self.enemy_above_parking = set()
 
+        # 每一步的规划截止时间(deadline.Deadline)，为None时不限制
+        self.deadline = None
+
+        # 排队执行的路径规划(plan_dispatcher.PlanDispatcher)，为None时在调度线程中逐批搜索
+        self.plan_dispatcher = None
+
 
 env = Env()
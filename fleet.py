@@ -0,0 +1,168 @@
+import numpy as np
+
+from model import Coordinate, UAV
+
+# 列名，每列是一个按行号索引的NumPy数组
+COLUMNS = ('x', 'y', 'z', 'remain_electricity', 'load_weight', 'capacity', 'charge', 'price',
+           'goods_no', 'task_type', 'next_x', 'next_y', 'next_z', 'has_next')
+# 与列同名的UAV字段，loc对应x、y、z三列
+UAV_COLUMNS = frozenset(('remain_electricity', 'load_weight', 'capacity', 'charge', 'price', 'goods_no'))
+
+
+class FleetUAV(UAV):
+    """
+    Agent持有的无人机信息。分配了行号之后，表中有对应列的字段在赋值时同时写入FleetTable的该行
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.fleet = None  # 所在的FleetTable，未分配行号时为None
+        self.row = -1
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def from_uav(cls, uav: UAV):
+        """复制服务器下发的UAV对象"""
+        return cls(uav.no, uav.loc.x, uav.loc.y, uav.loc.z, uav.goods_no, uav.uav_type, uav.status,
+                   uav.remain_electricity, uav.price, uav.load_weight, uav.capacity, uav.charge)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name == 'loc' or name in UAV_COLUMNS:
+            fleet = self.fleet
+            if fleet is not None:
+                fleet.write_uav(self.row, name, value)
+
+
+class FleetTable:
+    """
+    己方无人机的列式状态表。
+    无人机编号重新映射为连续的行号(与env.agents的顺序一致)，每一列是一个NumPy数组，
+    全体无人机的距离、电量和相遇判断可以一次完成，不需要逐个Agent调用。
+    Agent通过Agent.row对应表中的一行，Agent的无人机信息(FleetUAV)、任务类型和下一步坐标在赋值时写入该行，
+    表始终与Agent一致；只有无人机增加或减少时sync才重新分配行号并复制整行。
+    """
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.index = {}  # 无人机编号 -> 行号
+        self.agents = []  # 行号 -> Agent
+        self._capacity = 0
+        self._reserve(capacity)
+
+    def _reserve(self, capacity):
+        if capacity <= self._capacity:
+            return
+        capacity = max(capacity, self._capacity * 2)
+        for name in COLUMNS:
+            column = np.zeros(capacity, dtype=np.bool_ if name == 'has_next' else np.int64)
+            if self._capacity:
+                column[:self._capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self._capacity = capacity
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name):
+        """有效行的列视图"""
+        return getattr(self, name)[:self.size]
+
+    def sync(self, agents: dict):
+        """
+        按env.agents的顺序分配行号，无人机没有增加或减少时不做任何事
+        :param agents: {无人机编号: Agent}
+        """
+        agent_list = list(agents.values())
+        if len(agent_list) == self.size and all(a is b for a, b in zip(agent_list, self.agents)):
+            return
+
+        for agent in self.agents:
+            agent.uav.fleet, agent.uav.row = None, -1
+        n = len(agent_list)
+        self._reserve(n)
+        self.size = n
+        self.index.clear()
+        self.agents = agent_list
+        for row, agent in enumerate(agent_list):
+            self.index[agent.uav.no] = row
+            uav = agent.uav
+            uav.fleet, uav.row = self, row
+            for name in UAV_COLUMNS:
+                self.write_uav(row, name, getattr(uav, name))
+            self.write_uav(row, 'loc', uav.loc)
+            self.write_agent(row, 'task_type', agent.task_type)
+            self.write_agent(row, 'next_step', agent.next_step)
+
+    def write_uav(self, row: int, name: str, value):
+        """写入FleetUAV的字段"""
+        if name == 'loc':
+            self.x[row], self.y[row], self.z[row] = value.x, value.y, value.z
+        else:
+            getattr(self, name)[row] = value if value is not None else 0
+
+    def write_agent(self, row: int, name: str, value):
+        """写入Agent的task_type或next_step"""
+        if name == 'task_type':
+            self.task_type[row] = value
+        elif value is None:
+            self.has_next[row] = False
+        else:
+            self.next_x[row], self.next_y[row], self.next_z[row] = value.x, value.y, value.z
+            self.has_next[row] = True
+
+    def manhattan_distance(self, target: Coordinate):
+        """全体无人机到target的平面曼哈顿距离"""
+        n = self.size
+        return np.abs(self.x[:n] - target.x) + np.abs(self.y[:n] - target.y)
+
+    def manhattan_dis_3d(self, target: Coordinate, h_low: int):
+        """全体无人机到target的曼哈顿距离，先上升(下降)到h_low再水平飞行，同route_plan.manhattan_dis_3d"""
+        n = self.size
+        return np.abs(self.x[:n] - target.x) + np.abs(self.y[:n] - target.y) + \
+            np.abs(self.z[:n] - h_low) + abs(target.z - h_low)
+
+    def battery_life(self, weight):
+        """
+        全体无人机载重weight时的续航步数，同Agent.battery_life，空载时为int64的最大值
+        :param weight: 重量，或重量数组(如全部货物的重量)，此时结果为无人机 × 重量的矩阵
+        """
+        n = self.size
+        weight = np.asarray(weight)
+        remain = self.remain_electricity[:n].reshape((n,) + (1,) * weight.ndim)
+        return np.where(weight == 0, np.iinfo(np.int64).max, remain // np.maximum(weight, 1))
+
+    def in_fog(self, fog_index):
+        """全体无人机当前位置是否处于雾区(spatial.FogIndex)，bool数组"""
+        n = self.size
+        return fog_index.in_fog_many(self.x[:n], self.y[:n], self.z[:n])
+
+    def encounter_mask(self, row: int, exclude: Coordinate = None):
+        """
+        第row个无人机与全体无人机是否会相遇(包括碰撞)，同route_plan.is_encounter
+        :param exclude: 下一步为该坐标的无人机不参与判断(如停机坪)
+        :return: bool数组
+        """
+        n = self.size
+        cx, cy, cz = self.x[:n], self.y[:n], self.z[:n]
+        nx, ny, nz = self.next_x[:n], self.next_y[:n], self.next_z[:n]
+        cxi, cyi, czi = cx[row], cy[row], cz[row]
+        nxi, nyi, nzi = nx[row], ny[row], nz[row]
+
+        # 碰撞
+        mask = (nx == nxi) & (ny == nyi) & (nz == nzi)
+        # 交换位置
+        mask |= (nx == cxi) & (ny == cyi) & (nz == czi) & (cx == nxi) & (cy == nyi) & (cz == nzi)
+        # 同一平面内相邻的两个无人机，在一个田字格内交叉飞行
+        if czi == nzi:
+            plane = (cz == czi) & (nz == czi) & (np.abs(cx - cxi) + np.abs(cy - cyi) == 1)
+            cross = (cx == cxi) & (nx == nxi) & (cxi != nxi) & (cy == nyi) & (ny == cyi)
+            cross |= (cy == cyi) & (ny == nyi) & (cyi != nyi) & (cx == nxi) & (nx == cxi)
+            mask |= plane & cross
+
+        mask &= self.has_next[:n]
+        if exclude is not None:
+            mask &= (nx != exclude.x) | (ny != exclude.y) | (nz != exclude.z)
+        if not self.has_next[row] or \
+                (exclude is not None and nxi == exclude.x and nyi == exclude.y and nzi == exclude.z):
+            mask[:] = False
+        return mask
@@ -0,0 +1,84 @@
+import numpy as np
+
+from fleet import FleetTable
+from model import GoodsState
+from route_plan import DIST_ESTIMATE_RATE
+
+
+class GoodsTable:
+    """
+    货物的列式表，列顺序与传入的货物列表一致。
+    批量计算全体无人机 × 货物的可搬运矩阵和收益矩阵，结果与逐个调用
+    Agent.battery_enough、Agent.estimate_earnings相同。
+    """
+
+    def __init__(self, goods: list):
+        """
+        :param goods: Goods对象列表
+        """
+        self.goods = goods
+        self.size = len(goods)
+        data = np.array([(g.no, g.start.x, g.start.y, g.end.x, g.end.y, g.weight, g.value, g.left_time, g.state)
+                         for g in goods], dtype=np.int64).reshape(-1, 9)
+        self.nos = data[:, 0]
+        self.start_x = data[:, 1]
+        self.start_y = data[:, 2]
+        self.end_x = data[:, 3]
+        self.end_y = data[:, 4]
+        self.weight = data[:, 5]
+        self.value = data[:, 6]
+        self.left_time = data[:, 7]
+        self.state = data[:, 8]
+
+    def __len__(self):
+        return self.size
+
+    def delivery_distance(self, h_low: int):
+        """从出现点到目标点的曼哈顿距离(先上升到h_low)，同manhattan_dis_3d(start, end, h_low)"""
+        return np.abs(self.start_x - self.end_x) + np.abs(self.start_y - self.end_y) + 2 * h_low
+
+    def blocked(self, enemies):
+        """
+        无法获取的货物：已经被拾起，或者有敌方无人机处于货物出现点的平面坐标
+        :param enemies: 敌方UAV对象列表
+        """
+        mask = self.state == GoodsState.CARRIED
+        if self.size:
+            start_keys = self.start_x * (1 << 16) + self.start_y
+            enemy_keys = np.array([e.loc.x * (1 << 16) + e.loc.y for e in enemies], dtype=np.int64)
+            mask |= np.isin(start_keys, enemy_keys)
+        return mask
+
+    def battery_enough(self, fleet: FleetTable, h_low: int):
+        """全体无人机 × 货物，电量是否足够把货物从出现点送到目标点，同Agent.battery_enough"""
+        dist = (self.delivery_distance(h_low) * DIST_ESTIMATE_RATE).astype(np.int64)
+        return fleet.battery_life(self.weight) >= dist[None, :]
+
+    def feasibility(self, fleet: FleetTable, h_low: int):
+        """
+        全体无人机 × 货物的可搬运矩阵：载重足够、货物消失前能到达出现点并且电量足够
+        :return: bool矩阵，行为fleet的行号，列为货物序号
+        """
+        n = fleet.size
+        x, y, z = fleet.x[:n, None], fleet.y[:n, None], fleet.z[:n, None]
+        # diagonal_dis_3d(uav.loc, goods.start, h_low)
+        dist = np.maximum(np.abs(x - self.start_x), np.abs(y - self.start_y)) + np.abs(z - h_low) + h_low
+        dist = (dist * DIST_ESTIMATE_RATE).astype(np.int64)
+        return (self.weight[None, :] <= fleet.load_weight[:n, None]) & \
+            (dist < self.left_time[None, :]) & \
+            self.battery_enough(fleet, h_low)
+
+    def earnings(self, fleet: FleetTable, h_low: int, mask=None):
+        """
+        全体无人机 × 货物的每一步收益，同Agent.estimate_earnings
+        :param mask: bool矩阵，为False的位置收益为0
+        """
+        n = fleet.size
+        x, y, z = fleet.x[:n, None], fleet.y[:n, None], fleet.z[:n, None]
+        # manhattan_dis_3d(uav.loc, goods.start, h_low) + manhattan_dis_3d(goods.start, goods.end, h_low)
+        dist = np.abs(x - self.start_x) + np.abs(y - self.start_y) + np.abs(z - h_low) + h_low + \
+            self.delivery_distance(h_low)
+        result = self.value / dist
+        if mask is not None:
+            result = np.where(mask, result, 0.0)
+        return result
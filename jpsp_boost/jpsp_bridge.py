@@ -1,4 +1,7 @@
+import numpy as np
+
 from model import Coordinate
+from spatial import Heightmap
 from jpsp_c_api import libjpsp
 
 
@@ -6,19 +9,17 @@ def xy_to_loc(x, y):
     return libjpsp.XYLoc(int(x), int(y))
 
 
-def make_map_data(map_width, map_height, buildings, search_height):
-    map_data = libjpsp.VecBool()
-
-    for _ in range(map_width * map_height):
-        map_data.append(True)
+def make_map_data(map_width, map_height, buildings, search_height, occupancy=None):
+    """
+    :param occupancy: 搜索高度平面内被占用的格子，(map_width, map_height)的bool数组，同MapGeometry.occupancy；
+                      为None时由buildings和search_height计算
+    """
+    if occupancy is None:
+        occupancy = ~Heightmap(map_width, map_height, buildings, search_height + 1).free_mask(search_height)
 
-    for building in buildings:
-        x1, y1, x2, y2, z1, z2 = building
-
-        if z1 <= search_height <= z2:
-            for x in range(x1, x2 + 1):
-                for y in range(y1, y2 + 1):
-                    map_data[x + y * map_width] = False
+    # 可以通行为True，下标为x + y * map_width，extend一次添加全部元素
+    map_data = libjpsp.VecBool()
+    map_data.extend((~np.asarray(occupancy).T.ravel()).tolist())
 
     return map_data
 
@@ -2,7 +2,10 @@ import os
 import platform
 from ctypes import *
 
-from model import Coordinate
+import numpy as np
+
+from model import Coordinate, CoordinatePool
+from spatial import Heightmap
 
 this_path = os.path.dirname(os.path.abspath(__file__))
 # class level loading lib
@@ -13,6 +16,23 @@ elif platform.system() == 'Linux':
 else:
     raise EnvironmentError('Not supported platform.')
 
+# 当前存活的库内对象数量，用于确认长时间对战中内存没有持续增长
+# 库中没有释放JPSPlusWrapper的函数，搜索对象在整场比赛中存在，不计数
+_live_objects = {'vector_loc': 0, 'vector_bool': 0}
+
+
+def live_native_objects():
+    """
+    当前存活的库内对象数量
+    :return: {类型: 数量}
+    """
+    return dict(_live_objects)
+
+
+class _XYLocData(Structure):
+    """与库中xyLoc内存布局相同的结构体(两个int16)，由Python分配和释放"""
+    _fields_ = [('x', c_int16), ('y', c_int16)]
+
 
 class XYLoc:
     libjpsp.new_xy_loc.restype = c_void_p
@@ -23,7 +43,9 @@ class XYLoc:
     libjpsp.get_y.argtypes = [c_void_p]
 
     def __init__(self, x, y):
-        self._xy_loc = libjpsp.new_xy_loc(x, y)
+        # 库中没有释放xyLoc的函数，使用Python持有的内存，对象回收时一起释放
+        self._data = _XYLocData(x, y)
+        self._xy_loc = addressof(self._data)
 
     def __repr__(self):
         return "(%d, %d)" % (self.x, self.y)
@@ -45,6 +67,7 @@ class XYLoc:
         return self._xy_loc
 
     def set_cref(self, ref):
+        self._data = None
         self._xy_loc = ref
 
     @property
@@ -81,10 +104,17 @@ class VectorLoc(object):
             self._vector_loc = libjpsp.new_vector_loc_arg(size, value)
         else:
             self._vector_loc = libjpsp.new_vector_loc()  # pointer to new vector
+        _live_objects['vector_loc'] += 1
 
     def __del__(self):
-        # when reference count hits 0 in Python,
-        libjpsp.delete_vector_loc(self._vector_loc)  # call C++ vector destructor
+        self.release()
+
+    def release(self):
+        """立即释放库内的vector，之后不能再使用"""
+        if self._vector_loc:
+            libjpsp.delete_vector_loc(self._vector_loc)  # call C++ vector destructor
+            self._vector_loc = None
+            _live_objects['vector_loc'] -= 1
 
     def __len__(self):
         return libjpsp.vector_loc_size(self._vector_loc)
@@ -96,6 +126,19 @@ class VectorLoc(object):
                 libjpsp.vector_loc_get(self._vector_loc, c_int(i)))
         raise IndexError('VectorLoc index out of range')
 
+    def to_array(self, out=None):
+        """
+        复制全部坐标，xyLoc在vector中连续存储，只需要一次内存复制
+        :param out: 复制到的int16数组，形状(容量, 2)，容量不足时分配新数组
+        :return: (n, 2)的int16数组，每行为(x, y)
+        """
+        n = len(self)
+        if out is None or len(out) < n:
+            out = np.empty((n, 2), dtype=np.int16)
+        if n:
+            memmove(out.ctypes.data, libjpsp.vector_loc_get(self._vector_loc, 0), n * sizeof(_XYLocData))
+        return out[:n]
+
     def __setitem__(self, key, value):
         if 0 <= key < len(self):
             libjpsp.vector_loc_set(self._vector_loc, c_int(key), value)
@@ -146,10 +189,61 @@ class VectorBool(object):
             self._vector_bool = libjpsp.new_vector_bool_arg(size, value)
         else:
             self._vector_bool = libjpsp.new_vector_bool()  # pointer to new vector
+        _live_objects['vector_bool'] += 1
+
+    # 能否直接写入vector<bool>的位存储，见_probe_bit_storage
+    _bit_storage = None
+
+    @staticmethod
+    def _bit_storage_address(ref):
+        """
+        vector<bool>位存储的起始地址。libstdc++和MSVC的vector<bool>第一个成员都是指向整数数组的指针，
+        第i位在第i // 8个字节的第i % 8位(小端)
+        """
+        return c_void_p.from_address(ref).value
+
+    @staticmethod
+    def _probe_bit_storage():
+        """用一个测试向量确认位存储的布局，与库内的vector_bool_get读出的值一致时才使用"""
+        values = np.random.RandomState(0).rand(131) < 0.5
+        vector = VectorBool(size=values.size, value=False)
+        address = VectorBool._bit_storage_address(vector.cref)
+        if not address:
+            return False
+        bits = np.packbits(values, bitorder='little')
+        memmove(address, bits.ctypes.data, bits.nbytes)
+        return [vector[i] for i in range(values.size)] == values.tolist()
+
+    @staticmethod
+    def from_array(values):
+        """
+        从bool数组创建
+        库中只有逐个元素的设置函数：位存储的布局与预期一致时(见_probe_bit_storage)，
+        创建向量后把打包的位一次复制到位存储；否则先用出现较多的值填充，再逐个设置另一种值的位置
+        :param values: 一维bool数组
+        """
+        values = np.ascontiguousarray(values, dtype=np.bool_).ravel()
+        size = values.size
+        if VectorBool._bit_storage is None:
+            VectorBool._bit_storage = VectorBool._probe_bit_storage()
+
+        if VectorBool._bit_storage and size:
+            vector = VectorBool(size=size, value=False)
+            bits = np.packbits(values, bitorder='little')
+            memmove(VectorBool._bit_storage_address(vector.cref), bits.ctypes.data, bits.nbytes)
+            return vector
+
+        fill = bool(np.count_nonzero(values) * 2 >= size)
+        vector = VectorBool(size=size, value=fill)
+        ref, vector_bool_set = vector.cref, libjpsp.vector_bool_set
+        for i in np.flatnonzero(values != fill).tolist():
+            vector_bool_set(ref, i, not fill)
+        return vector
 
     def __del__(self):
         # when reference count hits 0 in Python,
         libjpsp.delete_vector_bool(self._vector_bool)  # call C++ vector destructor
+        _live_objects['vector_bool'] -= 1
 
     def __len__(self):
         return libjpsp.vector_bool_size(self._vector_bool)
@@ -185,6 +279,29 @@ class VectorBool(object):
         libjpsp.clear_vector_bool(self._vector_bool)
 
 
+class PathBatch:
+    """
+    批量查询的结果，全部路径的坐标保存在一个数组中
+    第i条路径为coords[offsets[i]:offsets[i + 1]]，搜索不到路径时为空
+    """
+
+    def __init__(self, offsets, coords):
+        """
+        :param offsets: (n + 1,)的int32数组
+        :param coords: (坐标总数, 2)的int16数组，每行为(x, y)
+        """
+        self.offsets = offsets
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError('PathBatch index out of range')
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+
 class JPSPlus:
     libjpsp.new_jpsp_wrapper.restype = c_void_p
     libjpsp.new_jpsp_wrapper.argtypes = [c_void_p, c_int, c_int]
@@ -193,23 +310,29 @@ class JPSPlus:
     libjpsp.get_path.restype = c_void_p
     libjpsp.get_path.argtypes = [c_void_p, c_void_p, c_void_p]
 
-    def __init__(self, width, height, buildings: [tuple], search_height: int):
+    def __init__(self, width, height, buildings: [tuple] = None, search_height: int = None, occupancy=None):
+        """
+        :param occupancy: 搜索高度平面内被占用的格子，(width, height)的bool数组，同MapGeometry.occupancy；
+                          为None时由buildings和search_height计算
+        """
         self._width = width
         self._height = height
-        self._map = VectorBool(size=width * height, value=True)
+        if occupancy is None:
+            occupancy = ~Heightmap(width, height, buildings, search_height + 1).free_mask(search_height)
 
-        # Init map data.
-        for building in buildings:
-            x1, y1, x2, y2, z1, z2 = building
-            if z1 <= search_height <= z2:
-                for x in range(x1, x2 + 1):
-                    for y in range(y1, y2 + 1):
-                        self._map[x + y * width] = False
+        # Init map data, True means passable, index is x + y * width.
+        self._map = VectorBool.from_array(~np.asarray(occupancy).T.ravel())
 
         # Init JPSPlusWrapper obj.
         self._jpsp = libjpsp.new_jpsp_wrapper(
             self._map.cref, width, height)
 
+        # 整数坐标查询使用的起点和终点，同一个对象不能在多个线程中同时查询
+        self._start = _XYLocData()
+        self._end = _XYLocData()
+        self._start_ref = addressof(self._start)
+        self._end_ref = addressof(self._end)
+
     def print_map(self, start: XYLoc = None, end: XYLoc = None):
         padding = self._width + 8
         print("\n%s Map %s" % ("#" * padding, "#" * padding))
@@ -245,10 +368,100 @@ class JPSPlus:
         return VectorLoc(ref=path)
         # return path
 
+    def get_path_xy(self, sx: int, sy: int, ex: int, ey: int):
+        """
+        整数坐标查询，起点和终点写入对象持有的xyLoc，不创建新的库内对象
+        :return: VectorLoc
+        """
+        start, end = self._start, self._end
+        start.x, start.y = sx, sy
+        end.x, end.y = ex, ey
+        return VectorLoc(ref=libjpsp.get_path(self._jpsp, self._start_ref, self._end_ref))
+
+    def collect_paths(self, queries):
+        """
+        逐个查询同一高度平面内的多条路径，结果收集到一个PathBatch中。
+        只是调用方便的辅助函数：库中没有批量查询函数，每条路径仍是一次get_path调用，
+        省去的只有每条路径创建VectorLoc和坐标对象的开销
+        :param queries: (n, 4)的整数数组，每行为(sx, sy, ex, ey)
+        :return: PathBatch
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.int16).reshape(-1, 4)
+        n = len(queries)
+        offsets = np.zeros(n + 1, dtype=np.int32)
+        coords = np.empty((max(n, 1) * (self._width + self._height), 2), dtype=np.int16)
+        get_path, jpsp = libjpsp.get_path, self._jpsp
+        vector_loc_size = libjpsp.vector_loc_size
+        vector_loc_get, delete_vector_loc = libjpsp.vector_loc_get, libjpsp.delete_vector_loc
+        start, end = self._start, self._end
+        start_ref, end_ref = self._start_ref, self._end_ref
+        item_size = sizeof(_XYLocData)
+        total = 0
+        for i, (sx, sy, ex, ey) in enumerate(queries.tolist()):
+            start.x, start.y, end.x, end.y = sx, sy, ex, ey
+            path = get_path(jpsp, start_ref, end_ref)
+            size = vector_loc_size(path)
+            if size:
+                if total + size > len(coords):
+                    coords = np.concatenate([coords, np.empty((max(total + size, len(coords)), 2), np.int16)])
+                memmove(coords.ctypes.data + total * item_size, vector_loc_get(path, 0), size * item_size)
+                total += size
+            delete_vector_loc(path)
+            offsets[i + 1] = total
+        return PathBatch(offsets, coords[:total])
+
+    def get_path_array(self, sx: int, sy: int, ex: int, ey: int, out=None):
+        """
+        整数坐标查询，路径一次复制到int16数组，搜索结果的vector随即释放
+        :param out: 复制到的int16数组，形状(容量, 2)，容量不足时分配新数组
+        :return: (n, 2)的int16数组，每行为(x, y)，搜索不到路径时n为0
+        """
+        path = self.get_path_xy(sx, sy, ex, ey)
+        try:
+            return path.to_array(out)
+        finally:
+            path.release()
+
+    @property
+    def cref(self):
+        return self._jpsp
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
 
 def xy_loc_to_coord(loc: XYLoc, height: int):
     return Coordinate(loc.x, loc.y, height)
 
 
-def to_coord_path(path: VectorLoc, height: int):
-    return [xy_loc_to_coord(path[i], height) for i in range(len(path))]
+def to_coord_path(path: VectorLoc, height: int, pool: CoordinatePool = None):
+    """
+    把搜索结果转换为Coordinate路径
+    :param pool: 坐标驻留表，指定时路径使用其中预先创建的共享坐标
+    """
+    if pool is None:
+        return [xy_loc_to_coord(path[i], height) for i in range(len(path))]
+    layer, width = pool.layer(height), pool.width
+    result = []
+    for i in range(len(path)):
+        loc = path[i]
+        result.append(layer[loc.x + loc.y * width])
+    return result
+
+
+def array_to_coord_path(points, height: int, pool: CoordinatePool = None):
+    """
+    把get_path_array的结果转换为Coordinate路径
+    :param points: (n, 2)的整数数组，每行为(x, y)
+    :param pool: 坐标驻留表，指定时路径使用其中预先创建的共享坐标
+    """
+    if pool is None:
+        return [Coordinate(x, y, height) for x, y in points.tolist()]
+    layer = pool.layer(height)
+    points = points.astype(np.intp)
+    return [layer[i] for i in (points[:, 0] + points[:, 1] * pool.width).tolist()]
@@ -1,5 +1,5 @@
 from jpsp_python.jps import Point, Node
-from model import Coordinate
+from model import Coordinate, CoordinatePool
 
 
 def xy_to_point(x, y) -> Point:
@@ -26,11 +26,12 @@ def buildings_to_obstacle_points(
     return obstacle_points
 
 
-def to_coordinate_path(path: [Point], height) -> [Coordinate]:
+def to_coordinate_path(path: [Point], height, pool: CoordinatePool = None) -> [Coordinate]:
+    new_coord = pool.get if pool is not None else Coordinate
     coordinate_path = []
     for point in path:
         x, y = point_to_xy(point)
-        coordinate_path.append(Coordinate(x, y, height))
+        coordinate_path.append(new_coord(x, y, height))
     return coordinate_path
 
 
@@ -1,6 +1,10 @@
 import heapq
 import math
 
+import numpy as np
+
+import jump_table
+
 
 # from model import Coordinate
 
@@ -643,6 +647,46 @@ class JPS:
                     else:
                         node.jp_distances[Direction.SOUTH_EAST] = jp_distance - 1
 
+    def preprocess(self):
+        """计算全部跳点和跳点距离"""
+        self.build_primary_points()
+        self.build_strait_jump_points()
+        self.build_diagonal_jump_points()
+
+    def export_tables(self):
+        """
+        导出预处理结果
+        :return: 跳点表，布局见jump_table
+        """
+        rows = []
+        for node in self.grid_nodes:
+            flags = 0
+            for d in range(8):
+                if node.jump_point_direction[d]:
+                    flags |= 1 << d
+            if node.is_jump_point:
+                flags |= jump_table.FLAG_JUMP_POINT
+            if node.is_obstacle:
+                flags |= jump_table.FLAG_OBSTACLE
+            rows.append(node.jp_distances + [flags])
+        return np.array(rows, dtype=np.int16).reshape(self.max_rows, self.row_size, jump_table.TABLE_FIELDS)
+
+    def import_tables(self, table):
+        """
+        导入预处理结果，代替build_*_jump_points()，障碍物以表中的标志位为准
+        :param table: 跳点表，布局见jump_table，可以是内存映射的数组
+        :return: 表与地图大小不匹配时返回False
+        """
+        if not jump_table.check_table(table, self.max_rows, self.row_size):
+            return False
+        for node, values in zip(self.grid_nodes, table.reshape(-1, jump_table.TABLE_FIELDS).tolist()):
+            flags = values[jump_table.FLAGS]
+            node.jp_distances = values[:jump_table.FLAGS]
+            node.jump_point_direction = [flags >> d & 1 == 1 for d in range(8)]
+            node.is_jump_point = flags & jump_table.FLAG_JUMP_POINT != 0
+            node.is_obstacle = flags & jump_table.FLAG_OBSTACLE != 0
+        return True
+
     @staticmethod
     def octile_heuristic(cur_row, cur_col, goal_row, goal_col):
         # 斜角距离启发函数
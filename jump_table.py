@@ -0,0 +1,45 @@
+"""
+JPS+跳点表的二进制布局。jpsp_python.jps.JPS按这个格式导出和导入预处理结果，
+表可以直接写入.npy文件并内存映射，导入后跳过预处理。
+libjpsp没有导出跳点表的接口，jpsp_c_api.jpsp_bridge.JPSPlus不支持导出和导入，每次都需要预处理。
+
+表为int16数组，形状(rows, cols, TABLE_FIELDS)，行优先连续存储，rows对应y，cols对应x：
+    [..., 0:8]  8个方向的跳点距离，方向顺序同jpsp_python.jps.Direction(N, NE, E, SE, S, SW, W, NW)，
+                北为行号减小的方向；正数为到跳点的距离，0或负数为到障碍物(边界)距离的相反数
+    [..., 8]    标志位：第d位为该方向的jump_point_direction，另有FLAG_JUMP_POINT和FLAG_OBSTACLE
+"""
+import numpy as np
+
+NUM_DIRECTIONS = 8
+TABLE_FIELDS = NUM_DIRECTIONS + 1
+FLAGS = NUM_DIRECTIONS  # 标志位所在的字段
+FLAG_JUMP_POINT = 1 << 8
+FLAG_OBSTACLE = 1 << 9
+
+
+def new_table(rows: int, cols: int):
+    return np.zeros((rows, cols, TABLE_FIELDS), dtype=np.int16)
+
+
+def check_table(table, rows: int, cols: int):
+    """表的形状和类型是否与地图匹配"""
+    return table.dtype == np.int16 and table.shape == (rows, cols, TABLE_FIELDS)
+
+
+def read_movingai_map(path: str):
+    """
+    读取MovingAI格式的地图(.map)
+    :return: 障碍物掩码，(rows, cols)的bool数组，'.'、'G'、'S'为可通行
+    """
+    with open(path) as f:
+        lines = f.read().split('\n')
+    header = {}
+    i = 0
+    while lines[i].strip() != 'map':
+        key, _, value = lines[i].partition(' ')
+        header[key] = value.strip()
+        i += 1
+    rows, cols = int(header['height']), int(header['width'])
+    grid = [line[:cols] for line in lines[i + 1:i + 1 + rows]]
+    return np.array([[c not in '.GS' for c in line] for line in grid], dtype=bool).reshape(rows, cols)
+
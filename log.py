@@ -0,0 +1,116 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+# 所有模块日志的父logger名称，通过它统一设置级别
+ROOT_NAME = 'uav'
+
+DEFAULT_FORMAT = '%(message)s'
+
+_listener = None
+_handler = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取模块日志对象，用法与标准库logging一致。
+    日志参数按 logger.debug('UAV %d', no) 的形式传入，只有级别开启时才会在后台线程格式化，
+    参数必须是之后不会被修改的对象(需要输出复用的缓冲区时先复制)。
+    """
+    return logging.getLogger('%s.%s' % (ROOT_NAME, name))
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    非阻塞的队列日志处理器，队列满时丢弃日志而不是阻塞主线程；
+    队列使用超过一半时，低于WARNING的日志每sample_every条只保留一条。
+    """
+
+    def __init__(self, log_queue: queue.Queue, sample_every: int):
+        super().__init__(log_queue)
+        self.sample_every = sample_every
+        self.dropped = 0
+        self._sample_count = 0
+        self._high_water = log_queue.maxsize // 2
+
+    def prepare(self, record):
+        # 不在调用线程中格式化，交给后台线程处理
+        return record
+
+    def enqueue(self, record):
+        if record.levelno < logging.WARNING and self.queue.qsize() > self._high_water:
+            self._sample_count += 1
+            if self._sample_count % self.sample_every:
+                self.dropped += 1
+                return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup(level=logging.INFO, modules: dict = None, silent=False, stream=None,
+          fmt=DEFAULT_FORMAT, queue_size=10000, sample_every=10):
+    """
+    初始化日志系统，日志由后台线程通过有界队列写出。
+    :param level: 全局日志级别
+    :param modules: 单独设置模块的日志级别, {'route_plan': logging.WARNING, ...}
+    :param silent: 静默模式，关闭所有日志，关闭的日志调用只有一次级别判断的开销
+    :param stream: 输出流，默认为sys.stdout
+    :param fmt: 日志格式
+    :param queue_size: 日志队列容量
+    :param sample_every: 队列拥堵时低级别日志的采样间隔
+    """
+    global _listener, _handler
+    shutdown()
+
+    root = logging.getLogger(ROOT_NAME)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    # 清除之前设置的模块级别
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith(ROOT_NAME + '.'):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    if silent:
+        root.setLevel(logging.CRITICAL + 1)
+        return
+
+    root.setLevel(level)
+    for name, module_level in (modules or {}).items():
+        logging.getLogger('%s.%s' % (ROOT_NAME, name)).setLevel(module_level)
+
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    _handler = _DroppingQueueHandler(queue.Queue(queue_size), sample_every)
+    root.addHandler(_handler)
+    _listener = logging.handlers.QueueListener(_handler.queue, stream_handler)
+    _listener.start()
+
+
+def dropped_count():
+    """由于队列拥堵丢弃的日志条数"""
+    return _handler.dropped if _handler else 0
+
+
+def shutdown():
+    """停止后台线程，写出队列中剩余的日志"""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        if _handler.dropped:
+            for handler in _listener.handlers:
+                handler.handle(logging.makeLogRecord(
+                    {'msg': '%d log records dropped' % _handler.dropped,
+                     'levelno': logging.WARNING, 'levelname': 'WARNING', 'name': ROOT_NAME}))
+        logging.getLogger(ROOT_NAME).removeHandler(_handler)
+        _listener = None
+        _handler = None
+
+
+atexit.register(shutdown)
@@ -1,36 +1,42 @@
 import json
+import logging
 import multiprocessing
+import os
 import socket
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import codec
+import log
+from comm import FrameReader
+from deadline import Deadline
 from env import env
 # from jpsp_boost import libjpsp
 from jpsp_c_api import jpsp_bridge as bridge
+from map_cache import MapCache
 from model import MapInfo, StepInfo, UAV, UAVStatus
+from plan_dispatcher import PlanDispatcher
+from profiler import profiler
+from recorder import MatchRecorder, RecordKind
 from route_plan import Agent
 from scheduler import schedule
+from world import WorldState
 
+logger = log.get_logger(__name__)
 
-# 从服务器接收一段字符串, 转化成字典的形式
-def recv_judger_data(h_socket):
-    n_ret = -1
-    len_json = int(h_socket.recv(8))
 
-    rcved, message = 0, bytes()
-    while rcved != len_json:
-        t = h_socket.recv(1024 * 4)
-        rcved += len(t)
-        message += t
+# 从服务器接收一帧消息, 转化成字典的形式
+def recv_judger_data(frame_reader: FrameReader):
+    frame = frame_reader.read_frame()
+    if frame is None:
+        # 连接已关闭，消息不完整
+        return -1, None
 
-    str_json = message.decode()
-    print("Recv: ", str_json)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Recv: %s", frame.decode())
 
-    if len(str_json) == len_json:
-        n_ret = 0
-    json_str = json.loads(str_json)
-
-    return n_ret, json_str
+    return 0, codec.loads(frame)
 
 
 # 接收一个字典,将其转换成json文件,并计算大小,发送至服务器
@@ -38,11 +44,11 @@ def send_judger_data(h_socket, dict_send):
     str_json = json.dumps(dict_send)
     len_json = str(len(str_json)).zfill(8)
     str_all = len_json + str_json
-    print("Send: ", str_all)
+    logger.debug("Send: %s", str_all)
     ret = h_socket.sendall(str_all.encode())
     if ret is None:
         ret = 0
-    print('sendall', ret)
+    logger.debug('sendall %s', ret)
     return ret
 
 
@@ -50,25 +56,79 @@ def send_judger_data(h_socket, dict_send):
 def algorithm_calculation_fun(map_info: MapInfo, step_info: StepInfo,
                               mp_pool: multiprocessing.Pool):
     """
-    算法主函数，接收服务器下达的对战信息，返回StepCommand对象的json。
+    算法主函数，接收服务器下达的对战信息，返回己方Agent列表和购买请求。
     :param mp_pool:
     :param map_info: 地图信息
     :param step_info: 接收服务器发送的对战信息。
-    :return: 计算后返回给服务器的下一步指令信息，即StepCommand的json。
+    :return: (Agent列表, 购买无人机列表)，由FlyPlaneEncoder序列化后发送给服务器。
     """
     return schedule(map_info, step_info, mp_pool)
 
 
-def main(sz_ip, n_port, sz_token, mp_pool: multiprocessing.Pool = None):
-    print("server ip %s, port %d, token %s\n" % (sz_ip, n_port, sz_token))
+def _init_finder(map_info: MapInfo, height: int):
+    """创建一个搜索高度的JPSPlus对象并预处理"""
+    map_w, map_h = map_info.map_range.x + 1, map_info.map_range.y + 1
+    finder = bridge.JPSPlus(map_w, map_h, occupancy=map_info.geometry.occupancy(height))
+    finder.preprocess()
+    return finder
+
+
+def init_jpsp_finders(map_info: MapInfo, workers: int = None):
+    """
+    初始化各个搜索高度的JPSPlus对象，全部完成后返回
+    :param workers: 预处理线程数，为None时同CPU核数；库函数调用期间释放GIL，不同高度的预处理可以并行。
+                    最常用的h_low最先提交，每个高度完成后立即放入env.jpsp_finders
+    """
+    jpsp_init_start_time = time.time()
+    heights = map_info.geometry.search_heights
+    workers = min(workers or os.cpu_count() or 1, len(heights))
+    if workers > 1:
+        with ThreadPoolExecutor(workers, thread_name_prefix='jpsp_init') as executor:
+            futures = {executor.submit(_init_finder, map_info, heights[0]): heights[0]}
+            futures.update((executor.submit(_init_finder, map_info, height), height) for height in heights[1:])
+            for future in as_completed(futures):
+                env.jpsp_finders[futures[future]] = future.result()
+    else:
+        for height in heights:
+            env.jpsp_finders[height] = _init_finder(map_info, height)
+
+    logger.info("JPS Plus finder init finished, %d layers, time %s",
+                len(heights), time.time() - jpsp_init_start_time)
+
+
+def init_agents(map_info: MapInfo, init_uav: list):
+    """
+    根据对战开始时的无人机信息初始化Agent
+    :param init_uav: 地图消息中的init_UAV列表
+    """
+    for uav_dic in init_uav:
+        uav = UAV.from_dict(uav_dic, map_info.uav_price[uav_dic['type']])
+        env.agents[uav.no] = Agent(uav=uav, map_info=map_info)
+
+
+def main(sz_ip, n_port, sz_token, mp_pool: multiprocessing.Pool = None, record_dir: str = None,
+         profile_dir: str = None, step_budget: float = None, cache_dir: str = None,
+         pool_processes: int = None, init_workers: int = None):
+    """
+    :param record_dir: 比赛记录目录，不为None时把每一步的收发消息和规划耗时写入二进制记录文件
+    :param profile_dir: 分阶段耗时统计目录，不为None时比赛结束后写入统计摘要和Chrome trace文件
+    :param step_budget: 每一步的规划时间预算(秒)，从收到对战信息开始计算，超时后发送保底飞行计划；
+                        为None时不限制
+    :param cache_dir: 地图预处理缓存目录，相同地图再次对战时从缓存加载MapGeometry；为None时不使用缓存。
+                      JPSPlus的预处理不能缓存，仍在每次对战开始时进行
+    :param pool_processes: mp_pool的进程数，为None时同multiprocessing.Pool的默认值
+    :param init_workers: 对战开始时各个搜索高度预处理的线程数，为None时同CPU核数
+    """
+    logger.info("server ip %s, port %d, token %s", sz_ip, n_port, sz_token)
 
     # 开始连接服务器
     h_socket = socket.socket()
 
     h_socket.connect((sz_ip, n_port))
+    frame_reader = FrameReader(h_socket)
 
     # 接受数据。连接成功后，Judger会返回一条消息：
-    n_ret, _ = recv_judger_data(h_socket)
+    n_ret, _ = recv_judger_data(frame_reader)
     if n_ret != 0:
         return n_ret
 
@@ -81,12 +141,12 @@ def main(sz_ip, n_port, sz_token, mp_pool: multiprocessing.Pool = None):
         return n_ret
 
     # 身份验证结果(Judger -> Player), 返回字典message
-    n_ret, message = recv_judger_data(h_socket)
+    n_ret, message = recv_judger_data(frame_reader)
     if n_ret != 0:
         return n_ret
 
     if message["result"] != 0:
-        print("token check error\n")
+        logger.error("token check error")
         return -1
 
     # 选手向裁判服务器表明自己已准备就绪(Player -> Judger)
@@ -97,18 +157,27 @@ def main(sz_ip, n_port, sz_token, mp_pool: multiprocessing.Pool = None):
         return n_ret
 
     # 对战开始通知(Judger -> Player)
-    n_ret, message = recv_judger_data(h_socket)
-    if n_ret != 0:
-        return n_ret
+    map_frame = frame_reader.read_frame()
+    if map_frame is None:
+        return -1
+    message = codec.loads(map_frame)
 
     # 初始化地图信息
     pst_map_info = message["map"]
 
-    # 初始化比赛状态信息
-    pst_match_status = {"time": 0}
+    # 初始化比赛状态信息，对战开始时刻为0
+    match_status = None
 
     # 初始化地图对象
-    map_info = MapInfo.from_dict(pst_map_info)
+    map_info = MapInfo.from_dict(pst_map_info, MapCache(cache_dir) if cache_dir else None)
+
+    # 对战状态，每一步的对战信息作为增量更新
+    world = WorldState(map_info)
+
+    # 比赛记录
+    recorder = MatchRecorder.in_dir(record_dir) if record_dir else None
+    if recorder:
+        recorder.record(RecordKind.MAP, 0, map_frame)
 
     # 初始化JPSPlus对象
     # height_list = [map_info.h_low] + [
@@ -121,87 +190,114 @@ def main(sz_ip, n_port, sz_token, mp_pool: multiprocessing.Pool = None):
     #     env.jpsp_finders[height].preprocess()
     # print("JPS Plus finder init finished, time %s" % (time.time() - jpsp_init_start_time))
 
-    height_list = [map_info.h_low] + [
-        b[-1] + 1 for b in map_info.buildings if map_info.h_low < b[-1] < map_info.h_high]
-    jpsp_init_start_time = time.time()
-    for height in set(height_list):
-        map_w, map_h = map_info.map_range.x + 1, map_info.map_range.y + 1
-        env.jpsp_finders[height] = bridge.JPSPlus(
-            map_w, map_h, buildings=map_info.buildings, search_height=height)
-        env.jpsp_finders[height].preprocess()
-    print("JPS Plus finder init finished, time %s" % (time.time() - jpsp_init_start_time))
+    init_jpsp_finders(map_info, init_workers)
+
+    # 同一步内排队的路径规划，在join时一起搜索
+    env.plan_dispatcher = PlanDispatcher(pool_processes)
 
     # 初始化飞机Planer
-    # agents = {}
-    for uav_dic in pst_map_info["init_UAV"]:
-        uav = UAV.from_dict(uav_dic, map_info.uav_price[uav_dic['type']])
-        env.agents[uav.no] = Agent(uav=uav, map_info=map_info)
+    init_agents(map_info, pst_map_info["init_UAV"])
 
     # 每一步的飞行计划
-    fly_plane_send = {"token": sz_token, "action": "flyPlane"}
+    fly_plane_encoder = codec.FlyPlaneEncoder(sz_token)
+
+    # 分阶段耗时统计
+    profiler.enable(profile_dir is not None)
+
+    # 每一步的规划截止时间
+    env.deadline = Deadline(step_budget) if step_budget is not None else None
+    frame_arrival = time.perf_counter()
 
     time_out_count = 0
     time_out_stats = {}
     time_span_list = []
-    # 根据服务器指令，不停的接受发送数据
-    while True:
-        step_time_start = time.time()
-
-        # 进行当前时刻的数据计算, 填充飞行计划，注意：1时刻不能进行移动，即第一次进入该循环时
-        if pst_match_status['time'] > 0:
-            step_info = StepInfo.from_dict(pst_match_status, map_info)
-        else:
-            step_info = None
-
-        # 调用路径规划算法
-        fly_plane, purchase_uav = algorithm_calculation_fun(map_info, step_info, mp_pool)
-
-        fly_plane_send['UAV_info'] = fly_plane
-        fly_plane_send['purchase_UAV'] = purchase_uav
-
-        time_span = time.time() - step_time_start
-        time_span_list.append(time_span)
-        print('Match time %s, plan time %s s' % (pst_match_status["time"], time_span))
-
-        if time_span >= 1:
-            time_out_count += 1
-            time_out_stats[step_info.time] = time_span
-            print('\033[1;31m%s\033[0m' % 'Timeout!' * 20)
-
-        # 发送飞行计划
-        n_ret = send_judger_data(h_socket, fly_plane_send)
-        if n_ret != 0:
-            return n_ret
-
-        # 接受当前比赛状态
-        n_ret, pst_match_status = recv_judger_data(h_socket)
-        if n_ret != 0:
-            return n_ret
-
-        if pst_match_status["match_status"] == 1:
-            step_info = StepInfo.from_dict(pst_match_status, map_info)
-            we_uav_value, enemy_uav_value = 0, 0
-            for uav_w in step_info.uav_we.values():
-                if uav_w.status != UAVStatus.CRASHED:
-                    we_uav_value += uav_w.price
-            for uav_e in step_info.uav_enemy.values():
-                if uav_e.status != UAVStatus.CRASHED:
-                    enemy_uav_value += uav_e.price
-            print("game over, we value %d, enemy value %d" %
-                  (step_info.we_value + we_uav_value, step_info.enemy_value + enemy_uav_value))
-            print("\033[1;31mTimeout count %d, stats %s\033[0m" % (time_out_count, time_out_stats))
-            print("\033[1;31mMean time %f, max time %f\033[0m" %
-                  (sum(time_span_list) / len(time_span_list),
-                   max(time_span_list)))
-            h_socket.close()
-            return 0
+    try:
+        # 根据服务器指令，不停的接受发送数据
+        while True:
+            step_time_start = time.time()
+
+            # 进行当前时刻的数据计算, 填充飞行计划，注意：1时刻不能进行移动，即第一次进入该循环时
+            if match_status is not None and match_status.time > 0:
+                step_info = match_status
+            else:
+                step_info = None
+            profiler.begin_step(step_info.time if step_info else 0)
+            if env.deadline is not None:
+                env.deadline.start(frame_arrival)
+
+            # 调用路径规划算法
+            fly_plane, purchase_uav = algorithm_calculation_fun(map_info, step_info, mp_pool)
+
+            time_span = time.time() - step_time_start
+            time_span_list.append(time_span)
+            match_time = step_info.time if step_info else 0
+            logger.info('Match time %s, plan time %s s', match_time, time_span)
+
+            if time_span >= 1:
+                time_out_count += 1
+                time_out_stats[match_time] = time_span
+                logger.warning('Timeout! match time %s, plan time %s s', match_time, time_span)
+
+            # 发送飞行计划
+            profiler.skip()
+            frame = fly_plane_encoder.encode(fly_plane, purchase_uav)
+            profiler.lap('serialize')
+            if logger.isEnabledFor(logging.DEBUG):
+                # 发送缓冲区会被复用，需要复制后再交给后台线程输出
+                logger.debug("Send: %s", bytes(frame).decode())
+            h_socket.sendall(frame)
+            if recorder:
+                recorder.record(RecordKind.SEND, match_time, frame, time_span)
+            profiler.lap('send')
+
+            # 接受当前比赛状态，等待服务器的时间不计入统计
+            frame = frame_reader.read_frame()
+            if frame is None:
+                return -1
+            frame_arrival = time.perf_counter()
+            profiler.skip()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Recv: %s", frame.decode())
+            match_status = world.apply_frame(frame)
+            profiler.lap('parse')
+            if recorder:
+                recorder.record(RecordKind.RECV, match_status.time, frame)
+
+            if match_status.match_status == 1:
+                step_info = match_status
+                we_uav_value, enemy_uav_value = 0, 0
+                for uav_w in step_info.uav_we.values():
+                    if uav_w.status != UAVStatus.CRASHED:
+                        we_uav_value += uav_w.price
+                for uav_e in step_info.uav_enemy.values():
+                    if uav_e.status != UAVStatus.CRASHED:
+                        enemy_uav_value += uav_e.price
+                logger.info("game over, we value %d, enemy value %d",
+                            step_info.we_value + we_uav_value, step_info.enemy_value + enemy_uav_value)
+                logger.info("Timeout count %d, stats %s", time_out_count, time_out_stats)
+                logger.info("Mean time %f, max time %f",
+                            sum(time_span_list) / len(time_span_list), max(time_span_list))
+                h_socket.close()
+                return 0
+    finally:
+        if env.plan_dispatcher is not None:
+            env.plan_dispatcher.close()
+        if recorder:
+            recorder.close()
+        if profile_dir is not None:
+            profiler.dump(profile_dir)
 
 
 if __name__ == "__main__":
     # pool = multiprocessing.Pool(8)
 
+    # 调试时输出每一步的收发消息和搜索信息: log.setup(level=logging.DEBUG)
+    # 正式比赛关闭全部日志: log.setup(silent=True)
+    log.setup(level=logging.INFO)
+
     # 100 * 100
-    main('59.110.142.4', 31739, 'd531e946-5ba6-47fd-b39b-1304a92491f2')
+    main('59.110.142.4', 31739, 'd531e946-5ba6-47fd-b39b-1304a92491f2', step_budget=0.9,
+         cache_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'map_cache'))
     #     "59.110.142.4", 31933, "7c2907df-3aa8 - 44f1-ae08-75ea542d1117"
 
     # 20 * 20
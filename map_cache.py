@@ -0,0 +1,101 @@
+"""
+地图预处理结果的磁盘缓存。
+比赛中的地图只有少数几张，相同地图的MapGeometry(每层的障碍物占用位图、搜索高度的可通行格子)每次启动都会重新计算。
+缓存按地图指纹(范围、h_low/h_high和建筑物)分目录保存，每个数组是一个.npy文件，
+加载时使用内存映射(mmap_mode='r')，不需要读入和解析整个文件。
+JPSPlus的跳点表在库内，库没有导出接口，不能缓存；启动时间主要是各个搜索高度的JPSPlus预处理，
+缓存只省去MapGeometry的计算(200×200的地图约40ms，预处理约0.9s)。
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import log
+
+logger = log.get_logger(__name__)
+
+# 缓存格式版本，数组布局改变时递增，旧的缓存自动失效
+CACHE_VERSION = 2
+
+
+def map_fingerprint(map_info):
+    """
+    地图指纹：只包含影响预处理结果的字段
+    :param map_info: model.MapInfo对象
+    :return: 十六进制字符串
+    """
+    key = {
+        'version': CACHE_VERSION,
+        'range': [map_info.map_range.x, map_info.map_range.y, map_info.map_range.z],
+        'h_low': map_info.h_low,
+        'h_high': map_info.h_high,
+        'buildings': sorted(list(b) for b in map_info.buildings),
+    }
+    return hashlib.sha1(json.dumps(key, separators=(',', ':')).encode()).hexdigest()
+
+
+class MapCacheEntry:
+    """一张地图的缓存目录，按名字读写数组"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.npy')
+
+    def __contains__(self, name):
+        return os.path.exists(self._file(name))
+
+    def load(self, name):
+        """
+        读取数组
+        :return: 只读的内存映射数组，不存在或文件损坏时返回None
+        """
+        try:
+            return np.load(self._file(name), mmap_mode='r', allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            logger.warning('Map cache %s/%s is broken, ignored: %s', self.path, name, e)
+            return None
+
+    def save(self, name, array):
+        """写入数组，先写临时文件再替换，多个进程同时写入时不会读到不完整的文件"""
+        os.makedirs(self.path, exist_ok=True)
+        tmp = '%s.%d.tmp' % (self._file(name), os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+            os.replace(tmp, self._file(name))
+        except OSError as e:
+            # 缓存只用于加速，写入失败不影响比赛
+            logger.warning('Failed to write map cache %s/%s: %s', self.path, name, e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def get_or_build(self, name, build):
+        """
+        读取数组，不存在时调用build()计算并写入缓存
+        :param build: 无参数函数，返回NumPy数组
+        """
+        array = self.load(name)
+        if array is None:
+            array = build()
+            self.save(name, array)
+        return array
+
+
+class MapCache:
+    """地图预处理缓存的根目录，每张地图对应一个以指纹命名的子目录"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def entry(self, map_info):
+        """
+        地图对应的缓存目录(可能还不存在，第一次写入时创建)
+        :param map_info: model.MapInfo对象
+        """
+        return MapCacheEntry(os.path.join(self.cache_dir, map_fingerprint(map_info)))
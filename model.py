@@ -1,52 +1,75 @@
 import json
 
+from spatial import FogIndex, Heightmap, MapGeometry
 
-class Coordinate:
-    """坐标运算类"""
+
+# 坐标打包为一个整数key：x, y, z各占COORD_BITS位，加上COORD_BIAS偏移后为非负数，分量范围为[-COORD_BIAS, COORD_BIAS)
+# 打包只在Coordinate.__init__和CoordinatePool.get中使用，为减少函数调用直接展开
+COORD_BITS = 16
+COORD_BIAS = 1 << (COORD_BITS - 1)
+
+
+class _CoordinateSlots:
+    __slots__ = ('x', 'y', 'z', 'key')
+
+
+_set_x = _CoordinateSlots.x.__set__
+_set_y = _CoordinateSlots.y.__set__
+_set_z = _CoordinateSlots.z.__set__
+_set_key = _CoordinateSlots.key.__set__
+
+
+class Coordinate(_CoordinateSlots):
+    """
+    坐标运算类。
+    坐标是不可变对象，可以被路径、Agent和调度器共享；x, y, z打包为整数key，比较和哈希只需要一次整数运算。
+    """
+    __slots__ = ()
 
     def __init__(self, x, y, z):
-        self.x = x
-        self.y = y
-        self.z = z
+        _set_x(self, x)
+        _set_y(self, y)
+        _set_z(self, z)
+        _set_key(self, ((x + COORD_BIAS) << (2 * COORD_BITS)) | ((y + COORD_BIAS) << COORD_BITS) | (z + COORD_BIAS))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Coordinate is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Coordinate is immutable')
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and \
-               self.x == other.x and self.y == other.y and self.z == other.z
+        return isinstance(other, Coordinate) and self.key == other.key
 
     def __ne__(self, other):
-        return not self.__eq__(other)
+        return not isinstance(other, Coordinate) or self.key != other.key
 
     def __copy__(self):
-        return self.__class__(self.x, self.y, self.z)
+        # 不可变对象不需要复制
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (self.x, self.y, self.z)
 
     def __add__(self, other):
-        if isinstance(other, self.__class__):
-            x = self.x + other.x
-            y = self.y + other.y
-            z = self.z + other.z
-        elif isinstance(other, tuple) and len(other) == 3:
-            x = self.x + other[0]
-            y = self.y + other[1]
-            z = self.z + other[2]
-        else:
-            x = y = z = -1
-        return self.__class__(x, y, z)
+        if isinstance(other, tuple) and len(other) == 3:
+            return Coordinate(self.x + other[0], self.y + other[1], self.z + other[2])
+        if isinstance(other, Coordinate):
+            return Coordinate(self.x + other.x, self.y + other.y, self.z + other.z)
+        return Coordinate(-1, -1, -1)
 
     def __sub__(self, other):
-        if isinstance(other, self.__class__):
-            x = self.x - other.x
-            y = self.y - other.y
-            z = self.z - other.z
-        elif isinstance(other, tuple) and len(other) == 3:
-            x = self.x - other[0]
-            y = self.y - other[1]
-            z = self.z - other[2]
-        else:
-            x = y = z = -1
-        return self.__class__(x, y, z)
+        if isinstance(other, Coordinate):
+            return Coordinate(self.x - other.x, self.y - other.y, self.z - other.z)
+        if isinstance(other, tuple) and len(other) == 3:
+            return Coordinate(self.x - other[0], self.y - other[1], self.z - other[2])
+        return Coordinate(-1, -1, -1)
 
     def __hash__(self):
-        return hash('%d%d%d' % (self.x, self.y, self.z))
+        return self.key
 
     def __str__(self):
         return "(%d, %d, %d)" % (self.x, self.y, self.z)
@@ -79,6 +102,44 @@ class Coordinate:
         return False
 
 
+class CoordinatePool:
+    """
+    单张地图的坐标驻留表，同一个格子只创建一个Coordinate对象，由路径、规划器和调度器共享。
+    搜索高度所在的平面可以通过layer一次性预先创建。
+    """
+
+    def __init__(self, map_range: Coordinate):
+        """
+        :param map_range: 地图范围，各分量为最大坐标
+        """
+        self.width = map_range.x + 1
+        self.height = map_range.y + 1
+        self._cells = {}  # key -> Coordinate
+        self._layers = {}  # z -> [Coordinate, ...]，下标为x + y * width
+
+    def __len__(self):
+        return len(self._cells)
+
+    def get(self, x, y, z):
+        """获取坐标(x, y, z)对应的共享Coordinate对象"""
+        key = ((x + COORD_BIAS) << (2 * COORD_BITS)) | ((y + COORD_BIAS) << COORD_BITS) | (z + COORD_BIAS)
+        c = self._cells.get(key)
+        if c is None:
+            c = self._cells[key] = Coordinate(x, y, z)
+        return c
+
+    def layer(self, z):
+        """
+        高度为z的平面内所有格子的共享Coordinate对象，第一次调用时创建
+        :return: 列表，坐标(x, y, z)的下标为x + y * width
+        """
+        cells = self._layers.get(z)
+        if cells is None:
+            get = self.get
+            cells = self._layers[z] = [get(x, y, z) for y in range(self.height) for x in range(self.width)]
+        return cells
+
+
 # class DictObj:
 #     def __init__(self, dic):
 #         self.dic = dic
@@ -166,6 +227,11 @@ class UAV:
         # 复赛新增字段
         self.remain_electricity = remain_electricity
 
+    def __copy__(self):
+        return self.__class__(self.no, self.loc.x, self.loc.y, self.loc.z, self.goods_no,
+                              self.uav_type, self.status, self.remain_electricity, self.price,
+                              self.load_weight, self.capacity, self.charge)
+
     def assign(self, other):
         self.no = other.no
         self.loc = other.loc
@@ -253,7 +319,7 @@ class MapInfo:
     """全局静态信息"""
 
     def __init__(self, map_range: Coordinate, parking: Coordinate, h_low: int, h_high: int,
-                 buildings: list, fogs: list, init_uav: dict, uav_price: dict):
+                 buildings: list, fogs: list, init_uav: dict, uav_price: dict, cache=None):
         """
         :param map_range: 地图范围 (x,y,z)
         :param parking: 停机坪信息 (x,y,z)
@@ -269,6 +335,7 @@ class MapInfo:
         无人机信息包括 编号和最大载重量，编号单方唯一"
         :param uav_price:"无人机价格表": "固定值，整个比赛过程中不变，no表示无人机购买编号，价格表根据载重不同，
         价值也不同，初始化的无人机中的载重必定在这个价格表中，方便统计最后价值"
+        :param cache: map_cache.MapCache对象，不为None时MapGeometry使用磁盘缓存
         """
         self.map_range = map_range
         self.parking = parking
@@ -280,8 +347,20 @@ class MapInfo:
         self.uav_price = {k: v for k, v in sorted(uav_price.items(), key=lambda x: -x[1].load_weight)}
         self.price_order = [k for k in self.uav_price.keys()][::-1]
 
+        # 坐标驻留表
+        self.coords = CoordinatePool(map_range)
+
+        # 建筑物高度图，O(1)判断坐标是否和建筑物重叠
+        self.heightmap = Heightmap(map_range.x + 1, map_range.y + 1, buildings, map_range.z + 1)
+
+        # 雾区索引，O(1)判断坐标是否处于雾区
+        self.fog_index = FogIndex(map_range.x + 1, map_range.y + 1, map_range.z + 1, fogs)
+
+        # 由地图推导的静态数据：搜索高度，可通行格子，停机坪垂直坐标，每层占用位图
+        self.geometry = MapGeometry(self, cache)
+
     @staticmethod
-    def from_dict(data_dict):
+    def from_dict(data_dict, cache=None):
         return MapInfo(
             map_range=Coordinate(*[data_dict['map'][k] - 1 for k in data_dict['map']]),
             parking=Coordinate(data_dict['parking']['x'], data_dict['parking']['y'], 0),
@@ -292,7 +371,8 @@ class MapInfo:
             fogs=[(f['x'], f['y'], f['x'] + f['l'] - 1, f['y'] + f['w'] - 1, f['b'], f['t'])
                   for f in data_dict['fog']],
             init_uav={uav['no']: UAV.from_dict(uav) for uav in data_dict['init_UAV']},
-            uav_price={a['type']: UAVPrice.from_dict(a) for a in data_dict['UAV_price']})
+            uav_price={a['type']: UAVPrice.from_dict(a) for a in data_dict['UAV_price']},
+            cache=cache)
 
 
 class StepInfo:
@@ -311,6 +391,11 @@ class StepInfo:
         self.enemy_value = enemy_value
         self.goods = goods
 
+        # 相对上一步发生变化的无人机和货物编号集合，由WorldState维护，None表示全部视为变化
+        self.changed_uav_we = None
+        self.changed_uav_enemy = None
+        self.changed_goods = None
+
     @staticmethod
     def from_dict(data_dict, map_info: MapInfo):
         return StepInfo(
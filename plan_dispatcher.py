@@ -0,0 +1,157 @@
+import math
+import os
+import time
+
+import numpy as np
+
+import log
+from deadline import DeadlineExceeded
+from env import env
+from jpsp_c_api import jpsp_bridge as bridge
+from plan_pool import PlanPool
+
+logger = log.get_logger(__name__)
+
+
+class PlanDispatcher:
+    """
+    一步内的路径规划请求先排队，join时一起搜索，结果与逐个调用Agent.plan相同。
+    提交时立即设置任务信息，路径在join时产生，调度器在gen_next_step之前调用join。
+    每个Agent最多有一个排队的请求：再次提交或直接调用Agent.plan时丢弃原请求(见Agent._set_task)，
+    join时任务类型或货物已经改变的请求也不再执行。
+    在最低的搜索高度一次查询全部请求(JPSPlus.collect_paths)，该高度搜索不到路径的Agent再逐个调用Agent.plan尝试其它高度。
+    本进程中不用线程并发搜索：libjpsp的搜索状态保存在JPSPlusWrapper内，没有可重入的查询函数，
+    每个线程需要一个完整预处理的JPSPlus副本，创建时间和内存与原对象相同，在单核的测试环境中也没有测得加速。
+    设置了进程池(use_pool)时，按测得的本进程每条路径的搜索耗时和进程池的往返开销估计，
+    分给工作进程(见plan_pool)更快的批次才使用进程池；进程池出错或超过规划截止时间时在本进程中搜索。
+    """
+
+    def __init__(self, processes: int = None):
+        """
+        :param processes: use_pool传入的进程池的进程数，为None时同multiprocessing.Pool的默认值os.cpu_count()
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self._requests = {}
+        self._pool = None
+        # 本进程中每条路径的平均搜索耗时(秒)，用于判断是否值得分给进程池
+        self._query_time = None
+
+    def __len__(self):
+        return len(self._requests)
+
+    def use_pool(self, mp_pool, map_info):
+        """
+        使用进程池搜索，同一个进程池和地图重复调用时不做任何事
+        :param mp_pool: multiprocessing.Pool对象
+        :param map_info: 当前对战的地图信息
+        """
+        if self._pool is not None and self._pool.pool is mp_pool and self._pool.map_info is map_info:
+            return
+        self.close()
+        self._pool = PlanPool(mp_pool, map_info, self.processes)
+
+    def close(self):
+        """对战结束，释放进程池搜索使用的地图数据"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def submit(self, agent, start, end, task_type, goods=None):
+        """
+        提交路径规划请求，使用默认障碍物(全部建筑物)，替换该Agent排队的请求
+        只设置任务信息和排队，不搜索路径；规划时间已用完时由join或cancel推迟到下一步
+        """
+        agent._set_task(task_type, goods)
+        self._requests[agent.uav.no] = (agent, start, end, task_type, agent.goods)
+
+    def discard(self, agent):
+        """丢弃Agent排队的请求，Agent重新设置任务时调用"""
+        self._requests.pop(agent.uav.no, None)
+
+    def _use_pool(self, n: int, search_height: int, timeout: float):
+        """
+        n条路径分给进程池是否比在本进程中搜索更快
+        进程数超过CPU核数的部分不能并行；工作进程预处理完成之前任务要排在预处理之后，也不使用
+        """
+        pool = self._pool
+        parallel = min(pool.processes, os.cpu_count() or 1)
+        if parallel < 2 or pool.failed or self._query_time is None or not pool.ready:
+            return False
+        if pool.overhead is None and pool.measure_overhead(search_height, timeout) is None:
+            return False
+        return n * self._query_time * (1 - 1 / parallel) > pool.overhead
+
+    @staticmethod
+    def _stale(request):
+        """提交之后Agent的任务已经改变"""
+        agent, start, end, task_type, goods = request
+        return agent.task_type != task_type or agent.goods is not goods
+
+    def cancel(self):
+        """规划时间已用完，排队的请求推迟到下一步(见Agent.resume_plan)"""
+        requests, self._requests = self._requests, {}
+        deferred = 0
+        for request in requests.values():
+            if not self._stale(request):
+                agent = request[0]
+                agent.pending_plan = (request[2], agent.map_info.buildings)
+                deferred += 1
+        if deferred:
+            logger.debug('%d queued plans deferred', deferred)
+
+    def join(self):
+        """执行全部排队的请求"""
+        if not self._requests:
+            return
+        deadline = env.deadline
+        if deadline is not None and deadline.expired:
+            self.cancel()
+            raise DeadlineExceeded('queued plans deferred')
+        requests = [request for request in self._requests.values() if not self._stale(request)]
+        self._requests = {}
+        if not requests:
+            return
+
+        map_info = requests[0][0].map_info
+        search_height = map_info.geometry.search_heights[0]
+        finder = env.jpsp_finders.get(search_height)
+        if map_info.map_range.x <= 0 or finder is None:
+            for agent, start, end, task_type, goods in requests:
+                agent.plan(start, end, task_type=task_type, goods=goods)
+            return
+
+        queries = np.array([(start.x, start.y, end.x, end.y) for _, start, end, _, _ in requests], dtype=np.int16)
+        batches = None
+        timeout = deadline.remaining if deadline is not None else None
+        if timeout is not None and not math.isfinite(timeout):
+            timeout = None
+        if self._pool is not None and self._use_pool(len(requests), search_height, timeout):
+            chunks = [c for c in np.array_split(np.arange(len(requests)), self._pool.processes) if len(c)]
+            batches = self._pool.get_paths(search_height, queries, chunks, timeout)
+            if batches is None and deadline is not None and deadline.expired:
+                self._requests = {request[0].uav.no: request for request in requests}
+                self.cancel()
+                raise DeadlineExceeded('queued plans deferred')
+        if batches is None:
+            start = time.perf_counter()
+            chunks = [np.arange(len(requests))]
+            batches = [finder.collect_paths(queries)]
+            query_time = (time.perf_counter() - start) / len(requests)
+            self._query_time = query_time if self._query_time is None else 0.8 * self._query_time + 0.2 * query_time
+
+        retry = {}
+        for batch, rows in zip(batches, chunks):
+            for j, i in enumerate(rows.tolist()):
+                agent, start, end, task_type, goods = requests[i]
+                points = batch[j]
+                if len(points):
+                    agent._set_path(start, end, bridge.array_to_coord_path(points, search_height, map_info.coords),
+                                    search_height)
+                else:
+                    retry[agent.uav.no] = requests[i]
+
+        # 最低高度搜索不到路径的请求，Agent.plan设置任务时把请求移出队列，超时后剩余的请求仍在队列中，由cancel推迟
+        self._requests = retry
+        while self._requests:
+            agent, start, end, task_type, goods = next(iter(self._requests.values()))
+            agent.plan(start, end, task_type=task_type, goods=goods)
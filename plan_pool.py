@@ -0,0 +1,140 @@
+"""
+进程池路径搜索：在multiprocessing.Pool的工作进程中批量查询JPS+路径。
+对战开始时把障碍物占用位图和建筑物高度图放入共享内存(见shared_tables)，工作进程收到第一个任务时按名字attach，
+由占用位图创建各个高度的JPSPlus对象并预处理；
+之后同一场对战的任务只携带查询坐标，结果以(offsets, coords)数组返回。
+不需要在创建进程池时指定地图，main中提前创建的进程池可以在多场对战中复用。
+"""
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import log
+from jpsp_c_api import jpsp_bridge as bridge
+from map_cache import map_fingerprint
+from shared_tables import SharedTables, share_map
+
+logger = log.get_logger(__name__)
+
+# 工作进程中的地图表和搜索对象，只属于一场对战
+_worker = {'key': None, 'tables': None, 'finders': {}}
+
+
+def _attach(key: str, spec: dict):
+    """工作进程映射共享的地图表，对战(地图)改变时丢弃原有的搜索对象"""
+    if _worker['tables'] is not None:
+        _worker['tables'].close()
+    _worker['key'] = None
+    _worker['finders'] = {}
+    _worker['tables'] = SharedTables.attach(spec)
+    _worker['key'] = key
+
+
+def _finder(search_height: int):
+    finder = _worker['finders'].get(search_height)
+    if finder is None:
+        tables = _worker['tables']
+        width, depth = tables['tops'].shape
+        occupancy = np.unpackbits(tables['occupancy'][search_height], axis=1, count=depth).astype(bool)
+        finder = bridge.JPSPlus(width, depth, occupancy=occupancy)
+        finder.preprocess()
+        _worker['finders'][search_height] = finder
+    return finder
+
+
+def prepare_finders(task: tuple):
+    """工作进程提前映射地图表并创建全部搜索高度的搜索对象，见PlanPool.__init__"""
+    key, spec, search_heights = task
+    if _worker['key'] != key:
+        _attach(key, spec)
+    for search_height in search_heights:
+        _finder(search_height)
+    return os.getpid()
+
+
+def search_paths(task: tuple):
+    """
+    工作进程执行的批量查询
+    :param task: (地图指纹, 共享地图表的spec, 搜索高度, (n, 4)的int16查询数组)
+    :return: (offsets, coords)，同jpsp_bridge.PathBatch
+    """
+    key, spec, search_height, queries = task
+    if _worker['key'] != key:
+        _attach(key, spec)
+    batch = _finder(search_height).collect_paths(queries)
+    return batch.offsets, batch.coords
+
+
+class PlanPool:
+    """
+    一场对战使用的进程池搜索后端
+    """
+
+    def __init__(self, pool, map_info, processes: int):
+        """
+        :param pool: multiprocessing.Pool对象
+        :param map_info: model.MapInfo对象
+        :param processes: 进程池的进程数，由创建进程池的一方给出
+        """
+        self.pool = pool
+        self.map_info = map_info
+        self.processes = processes
+        self.key = map_fingerprint(map_info)
+        self.tables = share_map(map_info)
+        self.spec = self.tables.spec()
+        # 一次空任务往返的耗时(秒)，预处理完成后由measure_overhead测量
+        self.overhead = None
+        # 工作进程出错(如共享的地图表已经释放)后不再使用
+        self.failed = False
+
+        # 在后台让工作进程预处理，不阻塞对战开始；任务由空闲的进程领取，不保证每个进程都执行一次，
+        # 没有执行的进程在第一次搜索时预处理
+        task = (self.key, self.spec, map_info.geometry.search_heights)
+        self._warmup = pool.map_async(prepare_finders, [task] * self.processes, chunksize=1)
+
+    @property
+    def ready(self):
+        """后台预处理已经完成，之后的任务不需要排在预处理之后"""
+        return self._warmup.ready()
+
+    def measure_overhead(self, search_height: int, timeout: float = None):
+        """
+        测量每个进程一个空任务的往返耗时，即分给进程池的固定开销
+        :return: 耗时(秒)，出错或超时时为None
+        """
+        chunks = [np.arange(0)] * self.processes
+        start = time.perf_counter()
+        if self.get_paths(search_height, np.empty((0, 4), dtype=np.int16), chunks, timeout) is None:
+            return None
+        self.overhead = time.perf_counter() - start
+        logger.debug('Pool overhead %.2f ms, %d processes', self.overhead * 1000, self.processes)
+        return self.overhead
+
+    def get_paths(self, search_height: int, queries, chunks: list, timeout: float = None):
+        """
+        把查询按chunks分给工作进程
+        :param queries: (n, 4)的整数数组，每行为(sx, sy, ex, ey)
+        :param chunks: 行号数组的列表，每个元素为一个任务
+        :param timeout: 等待结果的最长时间(秒)，为None时一直等待
+        :return: 与chunks对应的jpsp_bridge.PathBatch列表；工作进程出错或超时时为None，由调用者在本进程中搜索
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.int16)
+        tasks = [(self.key, self.spec, search_height, queries[rows]) for rows in chunks]
+        try:
+            results = self.pool.map_async(search_paths, tasks).get(timeout)
+        except multiprocessing.TimeoutError:
+            logger.warning('Pool search of %d paths timed out after %.3fs', len(queries), timeout)
+            return None
+        except Exception as e:
+            logger.warning('Pool search of %d paths failed: %r', len(queries), e)
+            self.failed = True
+            return None
+        return [bridge.PathBatch(offsets, coords) for offsets, coords in results]
+
+    def close(self):
+        """释放共享的地图表，进程池由创建者关闭；还没有映射地图表的预处理任务会失败，结果被忽略"""
+        if self.tables is not None:
+            self.tables.close()
+            self.tables = None
@@ -0,0 +1,166 @@
+import json
+import math
+import os
+import time
+
+import log
+
+logger = log.get_logger(__name__)
+
+# 直方图桶：1us ~ 10s 按对数等分，每个数量级BUCKETS_PER_DECADE个桶，另有下溢桶和上溢桶
+MIN_SECONDS = 1e-6
+DECADES = 7
+BUCKETS_PER_DECADE = 8
+NUM_BUCKETS = DECADES * BUCKETS_PER_DECADE + 2
+
+
+class Histogram:
+    """固定内存的对数刻度耗时直方图"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket_of(seconds: float):
+        if seconds < MIN_SECONDS:
+            return 0
+        i = int(math.log10(seconds / MIN_SECONDS) * BUCKETS_PER_DECADE) + 1
+        return i if i < NUM_BUCKETS else NUM_BUCKETS - 1
+
+    @staticmethod
+    def upper_bound(i: int):
+        """第i个桶的上界(秒)"""
+        if i >= NUM_BUCKETS - 1:
+            return math.inf
+        return MIN_SECONDS * 10 ** (i / BUCKETS_PER_DECADE)
+
+    def add(self, seconds: float):
+        self.counts[self.bucket_of(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float):
+        """按桶上界估计百分位数，上溢桶返回最大值"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.count))
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return min(self.upper_bound(i), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class StepProfiler:
+    """
+    分阶段统计每一步的耗时。
+    每一步开始时调用begin_step，每个阶段结束时调用lap(阶段名)，记录从上一次lap到现在的耗时。
+    耗时累积到固定内存的直方图中，最近trace_capacity个阶段保存在环形缓冲区中用于导出Chrome trace。
+    未启用时lap只有一次判断的开销。
+    """
+
+    def __init__(self, trace_capacity=200000):
+        self.enabled = False
+        self.trace_capacity = trace_capacity
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}
+        self._trace = [None] * self.trace_capacity
+        self._trace_pos = 0
+        self._trace_count = 0
+        self._origin = time.perf_counter()
+        self._last = self._origin
+        self._match_time = 0
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    def begin_step(self, match_time: int):
+        if not self.enabled:
+            return
+        self._match_time = match_time
+        self._last = time.perf_counter()
+
+    def lap(self, name: str):
+        """记录阶段name的耗时，即从上一次lap(或begin_step)到现在的时间"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        start, self._last = self._last, now
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        hist.add(now - start)
+
+        self._trace[self._trace_pos] = (name, start, now - start, self._match_time)
+        self._trace_pos = (self._trace_pos + 1) % self.trace_capacity
+        self._trace_count += 1
+
+    def skip(self):
+        """丢弃从上一次lap到现在的时间，不计入任何阶段(例如等待服务器消息)"""
+        if self.enabled:
+            self._last = time.perf_counter()
+
+    def summary(self):
+        """各阶段耗时统计，按总耗时从大到小排序"""
+        rows = []
+        for name, hist in self.histograms.items():
+            rows.append({'phase': name, 'count': hist.count, 'total': hist.total, 'mean': hist.mean,
+                         'p50': hist.percentile(50), 'p95': hist.percentile(95),
+                         'p99': hist.percentile(99), 'max': hist.max})
+        rows.sort(key=lambda r: -r['total'])
+        return rows
+
+    def format_summary(self):
+        lines = ['%-16s %8s %10s %10s %10s %10s %10s %10s' %
+                 ('phase', 'count', 'total(s)', 'mean(ms)', 'p50(ms)', 'p95(ms)', 'p99(ms)', 'max(ms)')]
+        for r in self.summary():
+            lines.append('%-16s %8d %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f' %
+                         (r['phase'], r['count'], r['total'], r['mean'] * 1e3, r['p50'] * 1e3,
+                          r['p95'] * 1e3, r['p99'] * 1e3, r['max'] * 1e3))
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """环形缓冲区中的阶段，转换为Chrome trace-event格式(complete事件, 单位us)"""
+        if self._trace_count < self.trace_capacity:
+            entries = self._trace[:self._trace_count]
+        else:
+            entries = self._trace[self._trace_pos:] + self._trace[:self._trace_pos]
+        return [{'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                 'ts': (start - self._origin) * 1e6, 'dur': dur * 1e6, 'args': {'time': match_time}}
+                for name, start, dur, match_time in entries]
+
+    def dump(self, dir_path: str, prefix='profile'):
+        """
+        输出统计摘要，并把摘要和Chrome trace文件写入dir_path
+        (trace文件可在chrome://tracing或Perfetto中打开)
+        :return: trace文件路径
+        """
+        if not self.enabled:
+            return None
+        logger.info('Step phase profile:\n%s', self.format_summary())
+        os.makedirs(dir_path, exist_ok=True)
+        name = '%s_%s_%d' % (prefix, time.strftime('%Y%m%d_%H%M%S'), os.getpid())
+        with open(os.path.join(dir_path, name + '.txt'), 'w') as f:
+            f.write(self.format_summary() + '\n')
+        trace_path = os.path.join(dir_path, name + '.trace.json')
+        with open(trace_path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+        return trace_path
+
+
+profiler = StepProfiler()
@@ -0,0 +1,165 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# 文件格式：
+#   文件头 FILE_HEADER: 魔数, 版本
+#   记录 RECORD_HEADER + 消息体: 类型, 标志位(是否压缩), 比赛时刻, 消息体长度, 耗时(秒)
+#   索引 INDEX_ENTRY * n: 每条记录的偏移, 比赛时刻, 类型
+#   文件尾 FOOTER: 索引偏移, 记录条数, 魔数
+# 比赛异常中断时没有索引和文件尾，读取时顺序扫描记录重建索引。
+FILE_MAGIC = b'HKMR'
+INDEX_MAGIC = b'HKMI'
+VERSION = 1
+
+FILE_HEADER = struct.Struct('<4sHH')
+RECORD_HEADER = struct.Struct('<BBHIId')
+INDEX_ENTRY = struct.Struct('<QIB')
+FOOTER = struct.Struct('<QI4s')
+
+FLAG_ZLIB = 0x01
+
+
+class RecordKind:
+    MAP = 0  # 对战开始时的地图消息
+    RECV = 1  # 每一步接收的对战信息
+    SEND = 2  # 每一步发送的飞行计划，耗时字段为该步的规划时间
+
+
+class MatchRecorder:
+    """把每一步接收的原始消息、发送的飞行计划和规划耗时追加写入二进制比赛记录文件"""
+
+    def __init__(self, path: str, compress=True, buffer_size=1024 * 1024):
+        """
+        :param path: 记录文件路径
+        :param compress: 是否使用zlib压缩消息体(压缩等级1，开销很小)
+        :param buffer_size: 文件写缓冲区大小
+        """
+        self.path = path
+        self.compress = compress
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, VERSION, 0))
+        self._offset = FILE_HEADER.size
+        self._index = bytearray()
+        self._count = 0
+
+    @staticmethod
+    def in_dir(dir_path: str, **kwargs):
+        """在指定目录下按当前时间创建记录文件"""
+        os.makedirs(dir_path, exist_ok=True)
+        name = 'match_%s_%d.hkm' % (time.strftime('%Y%m%d_%H%M%S'), os.getpid())
+        return MatchRecorder(os.path.join(dir_path, name), **kwargs)
+
+    def record(self, kind: int, match_time: int, payload, elapsed: float = 0.0):
+        """
+        追加一条记录
+        :param kind: 记录类型，见RecordKind
+        :param match_time: 比赛时刻
+        :param payload: 原始消息帧，bytes/bytearray/memoryview
+        :param elapsed: 耗时(秒)
+        """
+        flags = 0
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+            flags |= FLAG_ZLIB
+        self._file.write(RECORD_HEADER.pack(kind, flags, 0, match_time, len(payload), elapsed))
+        self._file.write(payload)
+
+        self._index += INDEX_ENTRY.pack(self._offset, match_time, kind)
+        self._offset += RECORD_HEADER.size + len(payload)
+        self._count += 1
+
+    def close(self):
+        """写入索引和文件尾"""
+        if self._file.closed:
+            return
+        self._file.write(self._index)
+        self._file.write(FOOTER.pack(self._offset, self._count, INDEX_MAGIC))
+        self._file.close()
+
+
+class MatchReader:
+    """通过内存映射随机读取比赛记录文件中的任意一条记录"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version, _ = FILE_HEADER.unpack_from(self._mm, 0)
+        if magic != FILE_MAGIC:
+            raise ValueError('Not a match record file: %s' % path)
+
+        # 记录偏移, 比赛时刻, 类型
+        self.offsets, self.times, self.kinds = [], [], []
+        if not self._load_index():
+            self._scan_records()
+
+    def _load_index(self):
+        size = len(self._mm)
+        if size < FILE_HEADER.size + FOOTER.size:
+            return False
+        index_offset, count, magic = FOOTER.unpack_from(self._mm, size - FOOTER.size)
+        if magic != INDEX_MAGIC or \
+                index_offset + count * INDEX_ENTRY.size + FOOTER.size != size:
+            return False
+        for offset, match_time, kind in INDEX_ENTRY.iter_unpack(
+                self._mm[index_offset:size - FOOTER.size]):
+            self.offsets.append(offset)
+            self.times.append(match_time)
+            self.kinds.append(kind)
+        return True
+
+    def _scan_records(self):
+        """没有索引时顺序扫描，忽略末尾不完整的记录"""
+        offset, size = FILE_HEADER.size, len(self._mm)
+        while offset + RECORD_HEADER.size <= size:
+            kind, _, _, match_time, length, _ = RECORD_HEADER.unpack_from(self._mm, offset)
+            if offset + RECORD_HEADER.size + length > size:
+                break
+            self.offsets.append(offset)
+            self.times.append(match_time)
+            self.kinds.append(kind)
+            offset += RECORD_HEADER.size + length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        """
+        读取第i条记录
+        :return: (类型, 比赛时刻, 耗时, 消息体bytes)
+        """
+        offset = self.offsets[i]
+        kind, flags, _, match_time, length, elapsed = RECORD_HEADER.unpack_from(self._mm, offset)
+        start = offset + RECORD_HEADER.size
+        payload = self._mm[start:start + length]
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        return kind, match_time, elapsed, payload
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def find(self, kind: int, match_time: int = None):
+        """查找指定类型(和比赛时刻)的记录序号列表"""
+        return [i for i in range(len(self)) if self.kinds[i] == kind and
+                (match_time is None or self.times[i] == match_time)]
+
+    def map_frame(self):
+        """对战开始时的地图消息"""
+        indices = self.find(RecordKind.MAP)
+        return self[indices[0]][-1] if indices else None
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
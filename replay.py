@@ -0,0 +1,239 @@
+"""
+离线回放工具：读取对战开始时的地图消息和每一步的对战信息，按main.main相同的流程初始化
+MapInfo、JPSPlus对象和Agent，不经过socket直接逐步调用scheduler.schedule，统计每一步的规划耗时。
+
+用法：
+    python replay.py match_xxx.hkm
+    python replay.py steps.jsonl --golden golden.jsonl --write-golden
+其中jsonl文件第一行为对战开始时的地图消息，之后每行为一步的对战信息。
+"""
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import codec
+import log
+from deadline import Deadline
+from env import env
+from jpsp_c_api import jpsp_bridge as bridge
+from main import init_agents, init_jpsp_finders
+from map_cache import MapCache
+from model import MapInfo
+from plan_dispatcher import PlanDispatcher
+from profiler import profiler
+from recorder import MatchReader, RecordKind
+from scheduler import schedule
+from world import WorldState
+
+logger = log.get_logger(__name__)
+
+
+def load_frames(path: str):
+    """
+    读取比赛记录
+    :return: (地图消息帧, [对战信息帧, ...], [已发送的飞行计划帧, ...]或None)
+    """
+    if path.endswith('.hkm'):
+        with MatchReader(path) as reader:
+            map_frame = reader.map_frame()
+            step_frames = [reader[i][-1] for i in reader.find(RecordKind.RECV)]
+            sent_frames = [reader[i][-1] for i in reader.find(RecordKind.SEND)]
+        return map_frame, step_frames, sent_frames
+
+    with open(path, 'rb') as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    return lines[0], lines[1:], None
+
+
+def percentile(values: list, q: float):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def plan_to_dict(frame):
+    """解析飞行计划帧(8位长度头 + json)，只保留用于比较的字段"""
+    plan = codec.loads(bytes(frame[8:]))
+    return {'UAV_info': plan.get('UAV_info', []), 'purchase_UAV': plan.get('purchase_UAV', [])}
+
+
+def replay(map_frame, step_frames: list, budget=1.0, trace_alloc=False, deadline=None, cache_dir=None,
+           mp_pool=None, pool_processes=None, init_workers=None):
+    """
+    回放一场比赛
+    :param map_frame: 对战开始时的地图消息
+    :param step_frames: 每一步的对战信息
+    :param budget: 每一步的时间预算(秒)
+    :param trace_alloc: 是否使用tracemalloc统计每一步的内存峰值(会显著降低运行速度)
+    :param deadline: 每一步的规划截止时间预算(秒)，超时后使用保底飞行计划，为None时不限制
+    :param cache_dir: 地图预处理缓存目录，为None时不使用缓存
+    :param mp_pool: 传给schedule的进程池，为None时不使用
+    :param pool_processes: mp_pool的进程数
+    :param init_workers: 搜索高度预处理的线程数，为None时同CPU核数
+    :return: (每一步的统计信息列表, 每一步的飞行计划列表)
+    """
+    map_dict = codec.loads(map_frame)
+    map_dict = map_dict.get('map', map_dict)
+    map_info = MapInfo.from_dict(map_dict, MapCache(cache_dir) if cache_dir else None)
+    world = WorldState(map_info)
+    init_jpsp_finders(map_info, init_workers)
+    env.plan_dispatcher = PlanDispatcher(pool_processes)
+    init_agents(map_info, map_dict['init_UAV'])
+    encoder = codec.FlyPlaneEncoder('replay')
+    env.deadline = Deadline(deadline) if deadline is not None else None
+
+    stats, plans = [], []
+    step_info = None
+    frames = [None] + list(step_frames)
+    for frame in frames:
+        if env.deadline is not None:
+            env.deadline.start()
+        if frame is not None:
+            profiler.skip()
+            step_info = world.apply_frame(frame)
+            profiler.lap('parse')
+            if step_info.match_status == 1:
+                # 比赛结束，main.main不再规划
+                break
+        cur_step = step_info if step_info is not None and step_info.time > 0 else None
+
+        if trace_alloc:
+            tracemalloc.reset_peak()
+        gc_before = sum(s['collections'] for s in gc.get_stats())
+        blocks_before = sys.getallocatedblocks()
+        time_start = time.perf_counter()
+
+        profiler.begin_step(cur_step.time if cur_step else 0)
+        agents, purchase = schedule(map_info, cur_step, mp_pool)
+        profiler.skip()
+        plan_frame = encoder.encode(agents, purchase)
+        profiler.lap('serialize')
+
+        time_span = time.perf_counter() - time_start
+        stats.append({
+            'time': cur_step.time if cur_step else 0,
+            'latency': time_span,
+            'blocks': sys.getallocatedblocks() - blocks_before,
+            'gc': sum(s['collections'] for s in gc.get_stats()) - gc_before,
+            'peak': tracemalloc.get_traced_memory()[1] if trace_alloc else 0,
+            'native': sum(bridge.live_native_objects().values())})
+        plans.append(plan_to_dict(plan_frame))
+
+        if time_span >= budget:
+            logger.warning('Match time %s over budget, plan time %s s', stats[-1]['time'], time_span)
+
+    return stats, plans
+
+
+def compare_plans(plans: list, golden: list):
+    """比较飞行计划，返回[(步序号, 说明), ...]"""
+    diffs = []
+    for i, (plan, expected) in enumerate(zip(plans, golden)):
+        if plan != expected:
+            uav_diff = [e.get('no') for p, e in zip(plan['UAV_info'], expected['UAV_info']) if p != e]
+            diffs.append((i, 'UAV %s differ, UAV count %d -> %d, purchase %s -> %s' %
+                          (uav_diff, len(expected['UAV_info']), len(plan['UAV_info']),
+                           expected['purchase_UAV'], plan['purchase_UAV'])))
+    if len(plans) != len(golden):
+        diffs.append((min(len(plans), len(golden)),
+                      'step count %d, golden %d' % (len(plans), len(golden))))
+    return diffs
+
+
+def report(stats: list, budget: float):
+    latency = [s['latency'] for s in stats]
+    blocks = [s['blocks'] for s in stats]
+    print('Steps %d, budget %s s, over budget %d' %
+          (len(stats), budget, sum(1 for t in latency if t >= budget)))
+    print('Latency p50 %.6f s, p95 %.6f s, p99 %.6f s, max %.6f s' %
+          (percentile(latency, 50), percentile(latency, 95), percentile(latency, 99),
+           max(latency) if latency else 0))
+    print('Allocated blocks per step p50 %d, p95 %d, max %d, gc collections %d' %
+          (percentile(blocks, 50), percentile(blocks, 95), max(blocks) if blocks else 0,
+           sum(s['gc'] for s in stats)))
+    if stats:
+        native = [s['native'] for s in stats]
+        print('Live native objects first step %d, last step %d, max %d' % (native[0], native[-1], max(native)))
+    if any(s['peak'] for s in stats):
+        peaks = [s['peak'] for s in stats]
+        print('Traced memory peak per step p50 %d B, max %d B' % (percentile(peaks, 50), max(peaks)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded matches through scheduler.schedule.')
+    parser.add_argument('record', help='.hkm match record, or jsonl file (map message + step messages)')
+    parser.add_argument('--budget', type=float, default=1.0, help='step time budget in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='numpy random seed')
+    parser.add_argument('--deadline', type=float,
+                        help='step deadline in seconds, send the fallback plan when exceeded')
+    parser.add_argument('--trace-alloc', action='store_true', help='trace per-step memory peak')
+    parser.add_argument('--golden', help='golden plans (jsonl) to compare with')
+    parser.add_argument('--write-golden', action='store_true', help='write plans to --golden instead')
+    parser.add_argument('--compare-recorded', action='store_true',
+                        help='compare with the plans recorded in the .hkm file')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='write per-phase latency summary and Chrome trace to DIR')
+    parser.add_argument('--map-cache', metavar='DIR', help='map preprocessing cache directory')
+    parser.add_argument('--plan-processes', type=int, default=0,
+                        help='path search processes, 0 to search in this process')
+    parser.add_argument('--init-workers', type=int, default=0,
+                        help='search height preprocessing threads, 0 for the number of CPUs')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    log.setup(level=args.log_level)
+    np.random.seed(args.seed)
+    if args.trace_alloc:
+        tracemalloc.start()
+    profiler.enable(args.profile is not None)
+
+    map_frame, step_frames, sent_frames = load_frames(args.record)
+    mp_pool = multiprocessing.Pool(args.plan_processes) if args.plan_processes > 0 else None
+    try:
+        stats, plans = replay(map_frame, step_frames, args.budget, args.trace_alloc, args.deadline,
+                              args.map_cache, mp_pool, args.plan_processes,
+                              args.init_workers or None)
+    finally:
+        if env.plan_dispatcher is not None:
+            env.plan_dispatcher.close()
+        if mp_pool is not None:
+            mp_pool.terminate()
+    report(stats, args.budget)
+    if args.profile:
+        print(profiler.format_summary())
+        print('Chrome trace written to %s' % profiler.dump(args.profile))
+
+    golden = None
+    if args.golden and args.write_golden:
+        with open(args.golden, 'w') as f:
+            for plan in plans:
+                f.write(json.dumps(plan) + '\n')
+        print('Golden plans written to %s' % args.golden)
+    elif args.golden:
+        with open(args.golden) as f:
+            golden = [json.loads(line) for line in f if line.strip()]
+    elif args.compare_recorded:
+        if sent_frames is None:
+            parser.error('--compare-recorded needs a .hkm record')
+        golden = [plan_to_dict(frame) for frame in sent_frames]
+
+    if golden is not None:
+        diffs = compare_plans(plans, golden)
+        for step, msg in diffs[:20]:
+            print('Step %d: %s' % (step, msg))
+        print('Behavior changes: %d steps' % len(diffs))
+        return 1 if diffs else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,12 +4,16 @@ import time
 import numpy as np
 from simpleai.search import astar
 
+import log
+from deadline import DeadlineExceeded
 from env import env
+from fleet import FleetUAV
 from jpsp_c_api import jpsp_bridge as bridge
 # from jpsp_boost.jpsp_bridge import loc_path_to_coordinate_path, xy_to_loc
-from model import Coordinate, Goods, MapInfo, StepInfo, UAV
+from model import Coordinate, CoordinatePool, Goods, MapInfo, StepInfo, UAV
 from search import HORIZONTAL_DIRECTIONS, RoutePlanProblem, VERTICAL_DIRECTIONS
 
+logger = log.get_logger(__name__)
 
 # Agent status状态码
 class TaskType:
@@ -111,13 +115,15 @@ class Agent:
         :param map_info: 地图信息
         :param jps_finders: JPS对象字典
         """
-        self.uav = uav
+        # Agent持有独立的副本，赋值时同时写入env.fleet中的行(见FleetTable)
+        self.uav = uav if isinstance(uav, FleetUAV) else FleetUAV.from_uav(uav)
         self.map_info = map_info
         self.problem = RoutePlanProblem(
             map_range=self.map_info.map_range,
             h_low=self.map_info.h_low,
             h_high=self.map_info.h_high,
-            obstacles=self.map_info.buildings)
+            obstacles=self.map_info.buildings,
+            obstacle_index=self.map_info.heightmap)
         self.path = None  # a list of points(Coordinate obj)
         self.index = 1  # 当前路径节点的索引，第0个为起始点，不用包含在返回路径中
         self.task_type = TaskType.NO_TASK  # Agent任务类型: 见TaskType
@@ -128,13 +134,42 @@ class Agent:
 
         self.goods = None  # 已经分配的货物
         self.next_step = None  # 缓存下一步的坐标
+        self.next_step_time = -1  # 产生next_step的比赛时刻
         self.usage = Usage.NORMAL
 
+        # 因规划超时被推迟的路径搜索(end, obstacles)，下一步继续
+        self.pending_plan = None
+
         # 其他参数
         self.approaching_threshold = self.map_info.map_range.x // 30
         if self.approaching_threshold < 1:
             self.approaching_threshold = 1
 
+    @property
+    def row(self):
+        """在env.fleet中的行号，由FleetTable.sync分配"""
+        return self.uav.row
+
+    @property
+    def task_type(self):
+        return self._task_type
+
+    @task_type.setter
+    def task_type(self, value):
+        self._task_type = value
+        if self.uav.fleet is not None:
+            self.uav.fleet.write_agent(self.uav.row, 'task_type', value)
+
+    @property
+    def next_step(self):
+        return self._next_step
+
+    @next_step.setter
+    def next_step(self, value):
+        self._next_step = value
+        if self.uav.fleet is not None:
+            self.uav.fleet.write_agent(self.uav.row, 'next_step', value)
+
     def __gt__(self, other):
         """加入优先权队列使用，大价值的无人机优先充电"""
         return self.uav.price > other.uav.price
@@ -230,22 +265,25 @@ class Agent:
             map_range=self.map_info.map_range,
             h_low=self.map_info.h_low,
             h_high=self.map_info.h_low,
-            obstacles=self.map_info.buildings)
+            obstacles=self.map_info.buildings,
+            obstacle_index=self.map_info.heightmap)
         self.path = None  # a list of points(Coordinate obj)
         self.index = 1  # 当前路径节点的索引，第0个为起始点，不用包含在返回路径中
         self.task_type = TaskType.NO_TASK  # Agent状态：详见TaskType
         self.task_priority = TaskPriority.look_up(TaskType.NO_TASK)
         self.goods = None  # 已经分配的货物
         self.next_step = self.uav.loc  # 缓存下一步的坐标
+        self.pending_plan = None
 
     @staticmethod
-    def vertical_path(x, y, start_h, end_h):
-        """生成垂直路径"""
+    def vertical_path(x, y, start_h, end_h, pool: CoordinatePool = None):
+        """生成垂直路径，指定坐标驻留表pool时使用其中的共享坐标"""
+        new_coord = pool.get if pool is not None else Coordinate
         if start_h < end_h:
-            return [Coordinate(x, y, i)
+            return [new_coord(x, y, i)
                     for i in range(start_h, end_h + 1)]
         else:
-            return [Coordinate(x, y, i)
+            return [new_coord(x, y, i)
                     for i in reversed(range(end_h, start_h + 1))]
 
     def _search(self, start, end, search_height, obstacles=None):
@@ -261,58 +299,72 @@ class Agent:
             #     xy_to_loc(start.x, start.y), xy_to_loc(end.x, end.y))
             # print("time %s" % (time.time() - jpsp_start_time))
 
-            print("UAV %d, JPSPlus search, height %d, " % (self.uav.no, search_height), end='')
-
             jpsp_start_time = time.time()
-            jpsp_path = env.jpsp_finders[search_height].get_path(
-                bridge.XYLoc(start.x, start.y), bridge.XYLoc(end.x, end.y))
-            print("time %s" % (time.time() - jpsp_start_time))
-
+            jpsp_path = env.jpsp_finders[search_height].get_path_array(start.x, start.y, end.x, end.y)
             trans_start = time.time()
-            search_result = bridge.to_coord_path(path=jpsp_path, height=search_height)
-            print("Transform time %s" % (time.time() - trans_start))
+            search_result = bridge.array_to_coord_path(jpsp_path, height=search_height,
+                                                       pool=self.map_info.coords)
+            logger.debug("UAV %d, JPSPlus search, height %d, time %s, transform time %s",
+                         self.uav.no, search_height, trans_start - jpsp_start_time,
+                         time.time() - trans_start)
 
         else:
-            print("UAV %d, A-Star search, height %d, " % (self.uav.no, search_height), end='')
             self.problem.set_config(start=Coordinate(start.x, start.y, search_height),
                                     end=Coordinate(end.x, end.y, search_height),
                                     h_low=self.map_info.h_low,
                                     h_high=self.map_info.h_high,
                                     obstacles=obstacles,
-                                    map_range=self.map_info.map_range)
+                                    map_range=self.map_info.map_range,
+                                    obstacle_index=self.map_info.heightmap
+                                    if obstacles is self.map_info.buildings else None)
             a_star_start_time = time.time()
             search_result = astar(self.problem, graph_search=True)
-            print("time %s" % (time.time() - a_star_start_time))
+            logger.debug("UAV %d, A-Star search, height %d, time %s",
+                         self.uav.no, search_height, time.time() - a_star_start_time)
             search_result = [c for _, c in search_result.path()]
 
         return search_result if search_result else []
 
+    def _defer_plan(self, end: Coordinate, obstacles):
+        """规划时间已用完，保留原路径，路径搜索推迟到下一步"""
+        self.pending_plan = (end, obstacles)
+        logger.debug('UAV %d, deadline exceeded, plan to %s deferred', self.uav.no, end)
+        raise DeadlineExceeded('UAV %d plan deferred' % self.uav.no)
+
+    def resume_plan(self):
+        """从当前位置继续上一步被推迟的路径搜索"""
+        end, obstacles = self.pending_plan
+        self.plan(self.uav.loc, end, task_type=self.task_type, obstacles=obstacles)
+
     def plan(self, start: Coordinate, end: Coordinate, task_type,
              goods=None, obstacles=None):
-        """根据地图规划路径"""
-        if goods:
-            self.goods = goods
-        if not obstacles:
-            obstacles = self.map_info.buildings
-        self.task_type = task_type
-        self.task_priority = TaskPriority.look_up(task_type)
+        """
+        根据地图规划路径。
+        设置了env.deadline并且规划时间已用完时，只更新任务信息，路径搜索推迟到下一步(见resume_plan)，
+        并抛出DeadlineExceeded。
+        """
+        obstacles = self._set_task(task_type, goods, obstacles)
+
+        deadline = env.deadline
+        if deadline is not None and deadline.expired:
+            self._defer_plan(end, obstacles)
 
         # 在二维平面内搜索路径，高度从h_low开始，如果搜索不到说明该平面内不可达，
         # 那么下次搜索的平面高度为：比当前search_height高的最小building高度 + 1
-        # 搜索高度集合，building最后一个元素为top坐标
-        height_list = [self.map_info.h_low] + [b[-1] + 1 for b in self.map_info.buildings
-                                               if self.map_info.h_low < b[-1] < self.map_info.h_high]
-        height_list = list(set(height_list))
-        height_list.sort()
+        # 搜索高度集合在对战开始时计算一次，见MapGeometry.search_heights
+        height_list = list(self.map_info.geometry.search_heights)
         search_result, search_height = None, 0
         fail_count = 0  # 搜索失败次数，超过3次，则在剩余的高度内随机挑选
         while not search_result and len(height_list) > 0:
             if fail_count < 3:
                 search_height = height_list.pop(0)
             else:
-                print('#' * 100)
+                logger.debug('UAV %d, search failed %d times, pick a random height',
+                             self.uav.no, fail_count)
                 pop_idx = np.random.randint(0, len(height_list), size=1)
-                search_height = height_list.pop(pop_idx)
+                search_height = height_list.pop(int(pop_idx[0]))
+            if fail_count and deadline is not None and deadline.expired:
+                self._defer_plan(end, obstacles)
 
             #################################################################
             # 路径搜索
@@ -322,17 +374,33 @@ class Agent:
             fail_count += 1 if not search_result else 0
 
         if search_result:
-            # 产生三段路径：(start.x, start.y, start.z)->(start.x, start.y, h_low)->
-            # (end.x, end.y, h_low)->(end.x, end.y, end.z)
-            start_to_h_low = self.vertical_path(start.x, start.y, start.z, search_height)
-            h_low_to_end = self.vertical_path(end.x, end.y, search_height, end.z)
-
-            # self.path = [c for _, c in search_result.path()]
-            self.path = start_to_h_low[:-1] + search_result + h_low_to_end[1:]  # 剔除衔接的重复结点
-            self.index = 1
+            self._set_path(start, end, search_result, search_height)
         else:
             raise ValueError('No path, uav_no: %d start: %s, end: %s' % (self.uav.no, start, end))
 
+    def _set_task(self, task_type, goods=None, obstacles=None):
+        """设置任务信息，返回路径搜索使用的障碍物；排队的路径规划请求不再执行(见PlanDispatcher)"""
+        if env.plan_dispatcher is not None:
+            env.plan_dispatcher.discard(self)
+        if goods:
+            self.goods = goods
+        self.task_type = task_type
+        self.task_priority = TaskPriority.look_up(task_type)
+        self.pending_plan = None
+        return obstacles if obstacles else self.map_info.buildings
+
+    def _set_path(self, start: Coordinate, end: Coordinate, search_result: list, search_height: int):
+        """由search_height平面内的搜索结果产生完整路径"""
+        # 产生三段路径：(start.x, start.y, start.z)->(start.x, start.y, h_low)->
+        # (end.x, end.y, h_low)->(end.x, end.y, end.z)
+        pool = self.map_info.coords
+        start_to_h_low = self.vertical_path(start.x, start.y, start.z, search_height, pool)
+        h_low_to_end = self.vertical_path(end.x, end.y, search_height, end.z, pool)
+
+        # self.path = [c for _, c in search_result.path()]
+        self.path = start_to_h_low[:-1] + search_result + h_low_to_end[1:]  # 剔除衔接的重复结点
+        self.index = 1
+
     def take_detour(self, encounter_agent, arranged_agents, mode=DetourMode.AUTO):
         """
         当前无人机选择避障，垂直方向移动一格，或者水平方向移动。
@@ -348,7 +416,7 @@ class Agent:
                     if new_step != a.next_step and \
                             not is_encounter(self.uav.loc, new_step, a.uav.loc, a.next_step):
                         # 如果无任务就不用返回原来的路径
-                        print("\033[1;36mUAV %d, take a detour vertical.\033[0m" % self.uav.no)
+                        logger.debug("UAV %d, take a detour vertical.", self.uav.no)
                         return [new_step]  # if self.task_type == TaskType.NO_TASK else [new_step, self.uav.loc]
             if _mode != DetourMode.VERTICAL:
                 # 其次选择水平方向躲避
@@ -358,7 +426,7 @@ class Agent:
                         if new_step != a.next_step and \
                                 not is_encounter(self.uav.loc, new_step, a.uav.loc, a.next_step):
                             # 如果无任务就不用返回原来的路径
-                            print("\033[1;36mUAV %d, take a detour horizontal.\033[0m" % self.uav.no)
+                            logger.debug("UAV %d, take a detour horizontal.", self.uav.no)
                             return [new_step]  # if self.task_type == TaskType.NO_TASK else [new_step, self.uav.loc]
             # return [self.uav.loc]
 
@@ -376,6 +444,22 @@ class Agent:
             # self.index = 1
             self.next_step = self.uav.loc
 
+    def fallback_step(self, step_time: int):
+        """
+        规划超时后的保底下一步：本步已经产生了下一步则保持不变，
+        否则沿已有路径前进一步，路径已走完或与当前位置不相邻时原地悬停
+        """
+        if self.next_step_time == step_time:
+            return
+        self.next_step_time = step_time
+        self.next_step = self.uav.loc
+        if self.num_remain_steps > 0:
+            d = self.path[self.index] - self.uav.loc
+            if (d.z == 0 and max(abs(d.x), abs(d.y)) == 1) or \
+                    (d.x == d.y == 0 and abs(d.z) == 1):
+                self.next_step = self.path[self.index]
+                self.index += 1
+
     def backspace(self):
         """返回上一步状态"""
         if self.next_step != self.uav.loc:
@@ -395,8 +479,7 @@ class Agent:
                     self.uav.loc == self.map_info.parking:
                 # 执行充电任务的无人机已经到达停机坪，重置状态，等待重新安排任务
                 self.reset()
-                print("\033[1;33mUAV %d, charge task finished, reset now.\033[0m"
-                      % self.uav.no)
+                logger.debug("UAV %d, charge task finished, reset now.", self.uav.no)
             else:
                 if self.num_remain_steps <= 0:
                     # 不移动
@@ -425,12 +508,14 @@ class Agent:
 
                     # 飞机垂直上升到(x, y, h_low)
                     self.path = self.vertical_path(
-                        self.uav.loc.x, self.uav.loc.y, self.uav.loc.z, self.map_info.h_low)
+                        self.uav.loc.x, self.uav.loc.y, self.uav.loc.z, self.map_info.h_low,
+                        self.map_info.coords)
                     self.next_step = self.path[self.index]
                     self.index += 1
                 else:
                     # 有可能出错了，暂时原地不动
                     self.next_step = self.uav.loc
+        self.next_step_time = step_info.time
 
 
 if __name__ == '__main__':
@@ -3,10 +3,18 @@ import sys
 
 import numpy as np
 
+import log
+from deadline import DeadlineExceeded
 from env import env
-from model import Coordinate, Goods, GoodsState, MapInfo, StepInfo, UAV, UAVStatus
+from goods_table import GoodsTable
+from model import Coordinate, MapInfo, StepInfo, UAVStatus
+from plan_dispatcher import PlanDispatcher
+from profiler import profiler
 from route_plan import Agent, DIST_ESTIMATE_RATE, TaskType, Usage, diagonal_dis_3d, is_encounter, manhattan_dis_3d, \
     manhattan_distance
+from search import HORIZONTAL_DIRECTIONS
+
+logger = log.get_logger(__name__)
 
 
 def gen_random_points(num_points, map_info: MapInfo):
@@ -16,17 +24,15 @@ def gen_random_points(num_points, map_info: MapInfo):
     :param map_info: 当前地图信息
     :return:
     """
-    low, high = 0, map_info.map_range.x
-    xy = np.random.randint(low=low, high=high, size=(2, num_points))  # 生成随机坐标
-    points = [Coordinate(x=x, y=y, z=map_info.h_low) for x, y in zip(xy[0, :], xy[1, :])]
-
-    # 对于不合法的点(和障碍物重叠)，重新生成
-    for i in range(len(points)):
-        while points[i].is_overlap(map_info.buildings):
-            x, y = np.random.randint(low=0, high=map_info.map_range.x, size=2)
-            points[i] = Coordinate(x, y, map_info.h_low)
-
-    return points
+    # 在h_low平面内可以通行的格子中均匀选取，x, y的取值范围为[0, map_range.x)
+    xs, ys = map_info.geometry.free_cells(map_info.h_low)
+    high = map_info.map_range.x
+    candidates = np.flatnonzero((xs < high) & (ys < high))
+    if not len(candidates):
+        return [map_info.coords.get(map_info.parking.x, map_info.parking.y, map_info.h_low)] * num_points
+    idx = candidates[np.random.randint(low=0, high=len(candidates), size=num_points)]
+    coords = map_info.coords
+    return [coords.get(int(xs[i]), int(ys[i]), map_info.h_low) for i in idx]
 
 
 def validate_data(map_info: MapInfo, step_info: StepInfo, goods_to_carry: set):
@@ -39,7 +45,7 @@ def validate_data(map_info: MapInfo, step_info: StepInfo, goods_to_carry: set):
             continue
 
         if uav.no not in env.agents:
-            # 新增的无人机
+            # 新增的无人机，Agent复制一份UAV信息(StepInfo中的UAV对象被WorldState复用)
             env.agents[uav.no] = Agent(uav, map_info)
 
         if env.agents[uav.no].task_type == TaskType.TO_GOODS_START and \
@@ -47,8 +53,12 @@ def validate_data(map_info: MapInfo, step_info: StepInfo, goods_to_carry: set):
             # 已规划的货物不可搬运，终止任务（重置Agent）
             env.agents[uav.no].reset()
 
-        # 更新UAV信息
-        env.agents[uav.no].update_uav_info(uav)
+        # 更新UAV信息，与Agent持有的副本比较而不是与上一步的服务器信息比较：Agent会在本地修改位置和载货编号，
+        # 服务器信息未变化时也要覆盖；其余字段不随对战变化，电量由Agent.update_electricity在本地维护，
+        # update_uav_info不复制电量
+        agent_uav = env.agents[uav.no].uav
+        if agent_uav.loc != uav.loc or agent_uav.goods_no != uav.goods_no or agent_uav.status != uav.status:
+            env.agents[uav.no].update_uav_info(uav)
 
     # 移除已经消失的货物
     for goods_no in list(env.goods_to_attack.keys()):
@@ -80,49 +90,45 @@ def validate_data(map_info: MapInfo, step_info: StepInfo, goods_to_carry: set):
 
 
 def arrange_uav(map_info: MapInfo, step_info: StepInfo, goods_to_arrange: set):
-    # 按货物价值由大到小排序
-    goods_objs = sorted([step_info.goods[no] for no in goods_to_arrange],
-                        key=lambda x: -x.value)
-
-    def _estimate_goods_earnings(agent: Agent, goods: Goods):
-        dist = diagonal_dis_3d(agent.uav.loc, goods_obj.start, map_info.h_low)
-        dist = int(dist * DIST_ESTIMATE_RATE)
-        if goods_obj.weight <= agent.uav.load_weight and \
-                dist < goods_obj.left_time and \
-                agent.battery_enough(goods_obj.weight, goods_obj.start, goods_obj.end):
-            # 可以搬运
-            if goods.state == GoodsState.CARRIED:
-                # 货物被捡起
-                if goods.no not in env.goods_to_attack:
-                    env.goods_to_attack[goods.no] = -1
-                return 0
-
-            for enemy in step_info.uav_enemy.values():
-                if enemy.loc.xy_equal(goods.start):
-                    if goods.no not in env.goods_to_attack:
-                        # 该货物已经无法获取
-                        env.goods_to_attack[goods.no] = -1
-                    return 0
-            return agent.estimate_earnings(goods)
-        else:
-            return 0
+    # 货物列顺序与goods_to_arrange的迭代顺序一致，收益相同时选择靠前的货物
+    goods_nos = list(goods_to_arrange)
+    if not goods_nos:
+        return {}
+    goods_table = GoodsTable([step_info.goods[no] for no in goods_nos])
+    fleet = env.fleet
+
+    # 可以搬运的无人机 × 货物
+    feasible = goods_table.feasibility(fleet, map_info.h_low)
+    # 货物被捡起，或者有敌方无人机处于货物出现点，已经无法获取
+    blocked = goods_table.blocked(step_info.uav_enemy.values())
+
+    arrangeable = np.array([a.task_type != TaskType.TO_GOODS_END and a.task_type != TaskType.ATTACK_ENEMY
+                            for a in fleet.agents], dtype=bool)
+    for k in np.flatnonzero(blocked & feasible[arrangeable].any(axis=0)):
+        if goods_nos[k] not in env.goods_to_attack:
+            env.goods_to_attack[goods_nos[k]] = -1
+
+    earnings = goods_table.earnings(fleet, map_info.h_low, feasible & ~blocked)
+    arranged = np.zeros(len(goods_nos), dtype=bool)
 
     for agent in env.agents.values():
         if agent.task_type == TaskType.TO_GOODS_END or \
                 agent.task_type == TaskType.ATTACK_ENEMY:
             # 正在运货的和攻击的无人机不安排
             continue
+        if env.deadline is not None:
+            env.deadline.check()
 
-        most_valuable_goods, max_earnings = None, 0
-        for goods_no in goods_to_arrange:
-            goods_obj = step_info.goods[goods_no]
-            earnings = _estimate_goods_earnings(agent, goods_obj)
-            if earnings > max_earnings:
-                most_valuable_goods, max_earnings = goods_obj, earnings
+        agent_earnings = np.where(arranged, 0.0, earnings[agent.row])
+        k = int(np.argmax(agent_earnings))
+        if agent_earnings[k] <= 0:
+            # 没有可以搬运的货物，保持原有任务
+            continue
+        most_valuable_goods = step_info.goods[goods_nos[k]]
 
-        if most_valuable_goods is not None:
-            # 已经分配了无人机
-            goods_to_arrange.remove(most_valuable_goods.no)
+        # 已经分配了无人机
+        goods_to_arrange.remove(most_valuable_goods.no)
+        arranged[k] = True
 
         if agent.task_type == TaskType.TO_GOODS_START and \
                 agent.goods.no == most_valuable_goods.no:
@@ -131,14 +137,14 @@ def arrange_uav(map_info: MapInfo, step_info: StepInfo, goods_to_arrange: set):
 
         # 重新规划任务目标
         if agent.task_type == TaskType.TO_GOODS_START:
-            print("\033[1;31mUAV %d, task goods changed: %d -> %d.\033[0m"
-                  % (agent.uav.no, agent.goods.no, most_valuable_goods.no))
+            logger.debug("UAV %d, task goods changed: %d -> %d.",
+                         agent.uav.no, agent.goods.no, most_valuable_goods.no)
         else:
-            print("\033[1;31mUAV %d, new task goods arranged: %d.\033[0m"
-                  % (agent.uav.no, most_valuable_goods.no))
+            logger.debug("UAV %d, new task goods arranged: %d.",
+                         agent.uav.no, most_valuable_goods.no)
 
-        agent.plan(agent.uav.loc, most_valuable_goods.start,
-                   task_type=TaskType.TO_GOODS_START)
+        _dispatcher().submit(agent, agent.uav.loc, most_valuable_goods.start,
+                             TaskType.TO_GOODS_START, goods=most_valuable_goods)
 
     return {}
 
@@ -159,7 +165,7 @@ def better_uav(map_info: MapInfo, step_info: StepInfo,
                     # 可以搬运
                     if goods_obj.value > agent.goods.value and dist <= agent.num_remain_steps and \
                             agent.battery_enough(goods_obj.weight, goods_obj.start, goods_obj.end):
-                        print("\033[1;31mUAV %d, path replan.\033[0m" % agent.uav.no)
+                        logger.debug("UAV %d, path replan.", agent.uav.no)
                         agent.plan(start=agent.uav.loc,
                                    end=goods_obj.start,
                                    goods=goods_obj,
@@ -174,18 +180,23 @@ def attack_enemy(map_info: MapInfo, step_info: StepInfo):
     :param step_info: 当前赛场信息，包括己方无人机信息，敌方无人机信息，货物信息等等。
     :return: 不需要返回，直接对Agent进行操作
     """
-    print('attack enemy')
     _threshold = manhattan_distance(Coordinate(0, 0, 0), map_info.map_range) / 2
-
-    print('threshold', _threshold)
+    logger.debug('attack enemy, threshold %s', _threshold)
 
     def _near(coord1, coord2, threshold):
         """ simplify, decide if attacker is near end """
         return manhattan_distance(coord1, coord2) <= threshold
 
-    def _done(enemy_id):  # 需要考虑雾区
-        uav = step_info.uav_enemy[enemy_id]
-        return uav.status == UAVStatus.CRASHED or uav.goods_no == -1
+    fog_index = map_info.fog_index
+
+    def _done(enemy_id):
+        uav = step_info.uav_enemy.get(enemy_id)
+        if uav is None or uav.status == UAVStatus.CRASHED:
+            return True
+        if uav.status == UAVStatus.IN_FOG or fog_index.coord_in_fog(uav.loc):
+            # 雾区中的敌方无人机信息不可靠，继续攻击，离开雾区后再判断是否仍然携带货物
+            return False
+        return uav.goods_no == -1
 
     def _valuable(enemy_id):
         # enemy should carry good, and good lifetime should be valid
@@ -209,9 +220,22 @@ def attack_enemy(map_info: MapInfo, step_info: StepInfo):
             if enemy_id and _done(enemy_id):
                 env.attackerToEnemy.pop(agent.uav.no)
                 agent.task_type = TaskType.NO_TASK
-                print('ATTACK -> NO_TASK')
+                logger.debug('UAV %d, ATTACK -> NO_TASK', agent.uav.no)
+
+    def _near_and_earlier(enemy_uav, _end):
+        # 全体己方无人机是否满足_near和_earlier，结果按env.fleet的行号索引
+        mask = attacker_mask.get(enemy_uav.no)
+        if mask is None:
+            h_low = map_info.h_low
+            enemy_dist = manhattan_dis_3d(enemy_uav.loc, Coordinate(_end.x, _end.y, 0), h_low)
+            mask = attacker_mask[enemy_uav.no] = \
+                (fleet.manhattan_distance(_end) <= _threshold) & \
+                (fleet.manhattan_dis_3d(_end, h_low) < enemy_dist)
+        return mask
 
     # idle -> attack    do assign & plan
+    fleet = env.fleet
+    attacker_mask = {}
     for agent in env.agents.values():
         if agent.task_type == TaskType.NO_TASK or agent.task_type == TaskType.TO_RANDOM_POINT:
             for enemy_uav in step_info.uav_enemy.values():
@@ -219,13 +243,12 @@ def attack_enemy(map_info: MapInfo, step_info: StepInfo):
                 if _enemy_id not in env.attackerToEnemy.values() \
                         and enemy_uav.status == UAVStatus.NORMAL \
                         and _valuable(_enemy_id):  # enemy 没有被assign && 可见 && 有价值
-                    print('In here')
                     goods_no = step_info.uav_enemy[_enemy_id].goods_no
                     x, y = step_info.goods[goods_no].end.x, step_info.goods[goods_no].end.y
                     _end = Coordinate(x, y, map_info.h_low)
                     # if _near(agent.uav.loc, _end, threshold):
-                    if _near(agent.uav.loc, _end, _threshold) and _earlier(agent.uav.loc, enemy_uav.loc, _end):
-                        print('NO_TASK->ATTACK')
+                    if _near_and_earlier(enemy_uav, _end)[agent.row]:
+                        logger.debug('UAV %d, NO_TASK -> ATTACK, enemy %d', agent.uav.no, _enemy_id)
                         env.attackerToEnemy[agent.uav.no] = _enemy_id
                         agent.plan(agent.uav.loc, _end, task_type=TaskType.ATTACK_ENEMY)
 
@@ -273,11 +296,18 @@ def avoid_self(map_info: MapInfo, step_info: StepInfo):
 
         return p_a if p_a.task_priority > p_b.task_priority else p_b
 
-    agent_list = list(env.agents.values())
+    # 按env.fleet的行顺序两两检查，先对整个编队批量判断相遇，只对可能相遇的无人机逐个处理
+    fleet = env.fleet
+    agent_list = fleet.agents
     for i in range(len(agent_list)):
         # 检查坐标合法性，避免碰撞
         p_i = agent_list[i]
-        for j in range(i + 1, len(agent_list)):
+        j = i + 1
+        while j < len(agent_list):
+            hits = np.flatnonzero(fleet.encounter_mask(i, exclude=map_info.parking)[j:])
+            if not len(hits):
+                break
+            j += int(hits[0])
             p_j = agent_list[j]
             if p_i.next_step != map_info.parking and p_j.next_step != map_info.parking:
                 # if p_i.next_step == p_j.next_step:
@@ -288,6 +318,7 @@ def avoid_self(map_info: MapInfo, step_info: StepInfo):
                     # 出现相遇的情况
                     tmp_p = _select(p_i, p_j)
                     tmp_p.take_detour(p_i if tmp_p != p_i else p_j, agent_list)
+            j += 1
 
 
 def purchase_uav(map_info: MapInfo, step_info: StepInfo,
@@ -351,26 +382,87 @@ def purchase_uav(map_info: MapInfo, step_info: StepInfo,
     return result
 
 
-def schedule(map_info: MapInfo, step_info: StepInfo,
-             mp_pool: multiprocessing.Pool):
+def fallback_plan(map_info: MapInfo, step_info: StepInfo):
     """
-    主调度程序，接收地图信息，服务器下达的对战信息以及当前己方无人机的Planer，
-    返回StepCommand对象的json。
-    :param mp_pool: 进程池对象
+    规划超时后的保底飞行计划：每个无人机沿已有路径前进一步(本步已产生下一步的保持不变)，
+    按任务优先级依次占用下一步坐标，和已占用坐标冲突的无人机原地悬停。
     :param map_info: 地图信息
-    :param step_info: 接收服务器发送的对战信息。
-    :return: 计算后返回给服务器的下一步指令信息，即StepCommand的json。
+    :param step_info: 当前赛场信息
     """
-    if not step_info:
-        # 此时不能移动无人机，返回无人机初始位置
-        uav_info = [a.uav.to_info_dict() for a in env.agents.values()]
-        return uav_info, []
+    agents = sorted(env.agents.values(), key=lambda x: -x.task_priority)
+    location = {a.uav.loc: a for a in agents}
+    occupied = {}  # 下一步坐标 -> Agent
+    hovering = set()  # 已经原地悬停的无人机编号
+
+    def _hover(agent):
+        # 原地悬停，已经占用该位置的无人机也只能悬停
+        # 已悬停的无人机不再处理，避免处于同一位置(如停机坪)的无人机互相替换导致死循环
+        while agent is not None and agent.uav.no not in hovering:
+            hovering.add(agent.uav.no)
+            if occupied.get(agent.next_step) is agent:
+                del occupied[agent.next_step]
+            agent.backspace()
+            other = occupied.get(agent.uav.loc)
+            occupied[agent.uav.loc] = agent
+            agent = other
+
+    for a in agents:
+        a.fallback_step(step_info.time)
+        if a.next_step == map_info.parking:
+            # 停机坪不会发生碰撞
+            continue
+        if a.next_step != a.uav.loc:
+            if a.next_step in occupied:
+                _hover(a)
+                continue
+            # 交换位置和交叉飞行的情况
+            neighbors = [location.get(a.next_step)] + \
+                        [location.get(a.uav.loc + di) for di in HORIZONTAL_DIRECTIONS]
+            if any(b is not None and b is not a and occupied.get(b.next_step) is b and
+                   is_encounter(a.uav.loc, a.next_step, b.uav.loc, b.next_step) for b in neighbors):
+                _hover(a)
+                continue
+            occupied[a.next_step] = a
+        else:
+            _hover(a)
+
+    for a in env.agents.values():
+        a.update_electricity(step_info.goods)
+
 
+def _dispatcher():
+    """路径规划请求的队列，没有设置env.plan_dispatcher时在调度线程中搜索"""
+    if env.plan_dispatcher is None:
+        env.plan_dispatcher = PlanDispatcher()
+    return env.plan_dispatcher
+
+
+def _stage_done(name: str):
+    """一个调度阶段结束，记录耗时并检查规划截止时间"""
+    profiler.lap(name)
+    if env.deadline is not None:
+        env.deadline.check()
+
+
+def _schedule_stages(map_info: MapInfo, step_info: StepInfo):
+    """依次执行各个调度阶段，规划超时时抛出DeadlineExceeded，返回购买请求"""
     # 待搬运的货物
     goods_to_carry = set([g.no for g in step_info.goods.values() if g.state == 0])
 
     # 合法化当前数据
     validate_data(map_info, step_info, goods_to_carry)
+    env.fleet.sync(env.agents)
+    _stage_done('validate_data')
+
+    # 继续上一步因超时被推迟的路径搜索
+    for a in env.agents.values():
+        if a.pending_plan is not None:
+            end, obstacles = a.pending_plan
+            if obstacles is map_info.buildings:
+                _dispatcher().submit(a, a.uav.loc, end, a.task_type)
+            else:
+                a.resume_plan()
+    _stage_done('resume_plan')
 
     # 已经分配了无人机的货物
     # goods_arranged = set([a.goods.no for a in env.agents.values() if
@@ -380,6 +472,7 @@ def schedule(map_info: MapInfo, step_info: StepInfo,
 
     # 分配无人机
     over_weight_stats = arrange_uav(map_info, step_info, goods_to_carry)
+    _stage_done('arrange_uav')
 
     # 已有任务的无人机选择更有价值的货物
     # better_uav(map_info, step_info, goods_to_arrange)
@@ -393,40 +486,76 @@ def schedule(map_info: MapInfo, step_info: StepInfo,
         for i, agent in enumerate(idle_agents):
             if agent.usage == Usage.ATTACK or agent.full_charged:
                 # 如果攻击型无人机则不考虑电量，运货的无人机需要考虑电量
-                agent.plan(start=agent.uav.loc, end=points[i],
-                           task_type=TaskType.TO_RANDOM_POINT)
+                _dispatcher().submit(agent, agent.uav.loc, points[i], TaskType.TO_RANDOM_POINT)
+    _stage_done('disperse')
 
     # 主动攻击敌方无人机
     try:
         attack_enemy(map_info, step_info)
+    except DeadlineExceeded:
+        raise
     except Exception:
         pass
+    _stage_done('attack_enemy')
+
+    # 执行排队的路径规划
+    _dispatcher().join()
+    _stage_done('join_plans')
 
     # 产生下一步的无人机坐标
-    goods_to_arrange_objs = sorted([step_info.goods[no] for no in goods_to_arrange],
+    goods_to_arrange_objs = sorted([step_info.goods[no] for no in goods_to_carry],
                                    key=lambda x: -x.value)
     for a in env.agents.values():
         a.gen_next_step(step_info, goods_to_arrange_objs)
+    _stage_done('gen_next_step')
 
     # 规避敌方无人机
     avoid_enemy(map_info, step_info)
+    _stage_done('avoid_enemy')
 
     # 规避己方无人机
     avoid_self(map_info, step_info)
+    _stage_done('avoid_self')
 
-    # 准备返回给服务器的无人机信息
-    uav_info = []
+    # 更新电量信息
     for a in env.agents.values():
-        # 更新电量信息
         a.update_electricity(step_info.goods)
-
-        # 构造返回消息
-        tmp_uav = UAV(a.uav.no, a.next_step.x, a.next_step.y, a.next_step.z, a.uav.goods_no,
-                      remain_electricity=a.uav.remain_electricity)
-
-        uav_info.append(tmp_uav.to_info_dict())
+    profiler.lap('electricity')
 
     # 购买无人机
     purchase_info = purchase_uav(map_info, step_info, over_weight_stats)
+    profiler.lap('purchase_uav')
+
+    return purchase_info
+
 
-    return uav_info, purchase_info
+def schedule(map_info: MapInfo, step_info: StepInfo,
+             mp_pool: multiprocessing.Pool):
+    """
+    主调度程序，接收地图信息，服务器下达的对战信息以及当前己方无人机的Planer，
+    返回己方Agent列表(下一步坐标为Agent.next_step)和购买请求。
+    设置了env.deadline时，规划超时会放弃未完成的阶段，改为发送保底飞行计划(见fallback_plan)。
+    :param mp_pool: 进程池对象，不为None时批量的路径搜索分给工作进程(见PlanDispatcher.use_pool)
+    :param map_info: 地图信息
+    :param step_info: 接收服务器发送的对战信息。
+    :return: (Agent列表, 购买无人机列表)，由codec.FlyPlaneEncoder序列化后发送给服务器。
+    """
+    if not step_info:
+        # 此时不能移动无人机，返回无人机初始位置
+        for a in env.agents.values():
+            a.next_step = a.uav.loc
+        return list(env.agents.values()), []
+
+    if mp_pool is not None:
+        _dispatcher().use_pool(mp_pool, map_info)
+
+    try:
+        purchase_info = _schedule_stages(map_info, step_info)
+    except DeadlineExceeded:
+        logger.warning('Match time %s, deadline exceeded, send fallback plan', step_info.time)
+        _dispatcher().cancel()
+        fallback_plan(map_info, step_info)
+        profiler.lap('fallback')
+        purchase_info = []
+
+    return list(env.agents.values()), purchase_info
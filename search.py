@@ -3,6 +3,7 @@ import time
 from simpleai.search import SearchProblem, astar
 
 from model import Coordinate
+from spatial import Heightmap
 
 HORIZONTAL_DIRECTIONS = [(-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0),
                          (-1, 1, 0), (1, 1, 0), (1, -1, 0), (-1, -1, 0)]
@@ -12,7 +13,7 @@ VERTICAL_DIRECTIONS = [(0, 0, -1), (0, 0, 1)]
 class RoutePlanProblem(SearchProblem):
 
     def __init__(self, map_range: Coordinate, h_low: int, h_high: int,
-                 obstacles: list, fogs=None, three_dim=False):
+                 obstacles: list, fogs=None, three_dim=False, obstacle_index: Heightmap = None):
         """
         初始化地图信息
         :param map_range: 地图 Coordinate对象
@@ -22,18 +23,21 @@ class RoutePlanProblem(SearchProblem):
         x1,y1表示障碍物的水平起始坐标， x2, y2表示水平终止坐标（x2=x1+l, y2=y1+w），
         z1,z2分别为垂直旗帜坐标
         :param three_dim: 是否在单位空间搜索路径
+        :param obstacle_index: obstacles对应的障碍物索引(spatial.Heightmap)，为None时逐个扫描obstacles
         """
         self.map_range = map_range
         self.h_low = h_low
         self.h_high = h_high
         self.obstacles = obstacles
+        self.obstacle_index = obstacle_index
         self.fogs = fogs
         self.end_state = None
         self.three_dim = three_dim
         super().__init__(None)
 
     def set_config(self, start: Coordinate, end: Coordinate, h_low: int, h_high: int,
-                   obstacles=None, map_range: Coordinate = None, three_dim=False):
+                   obstacles=None, map_range: Coordinate = None, three_dim=False,
+                   obstacle_index: Heightmap = None):
         """
         设置当前路径的起始点和飞行器所处的高度
         :param start: 路径起点 (start_x, start_y)
@@ -43,6 +47,7 @@ class RoutePlanProblem(SearchProblem):
         :param obstacles: 障碍物（建筑物，无人机）
         :param map_range: 当前地图搜索范围，Coordinate对象
         :param three_dim: 是否在单位空间搜索路径
+        :param obstacle_index: obstacles对应的障碍物索引，obstacles改变时需要一起指定
         """
         self.initial_state = start
         self.end_state = end
@@ -53,6 +58,13 @@ class RoutePlanProblem(SearchProblem):
             self.map_range = map_range
         if obstacles:
             self.obstacles = obstacles
+            self.obstacle_index = obstacle_index
+
+    def is_blocked(self, state: Coordinate):
+        """state是否和障碍物重叠"""
+        if self.obstacle_index is not None:
+            return self.obstacle_index.is_blocked(state.x, state.y, state.z)
+        return state.is_overlap(self.obstacles)
 
     def actions(self, state):
         if state != self.end_state:
@@ -64,7 +76,7 @@ class RoutePlanProblem(SearchProblem):
                     for di in HORIZONTAL_DIRECTIONS:
                         new_state = state + di
                         if new_state.is_valid(self.map_range.x, self.map_range.y, self.map_range.z) and \
-                                not new_state.is_overlap(self.obstacles):
+                                not self.is_blocked(new_state):
                             actions.append(di)
                 if state.z <= self.h_low:
                     # 不能小于最低飞行高度，只能往上飞
@@ -83,7 +95,7 @@ class RoutePlanProblem(SearchProblem):
                 for di in HORIZONTAL_DIRECTIONS:
                     new_state = state + di
                     if new_state.is_valid(self.map_range.x, self.map_range.y, self.map_range.z) and \
-                            not new_state.is_overlap(self.obstacles):
+                            not self.is_blocked(new_state):
                         actions.append(di)
             return actions
         else:
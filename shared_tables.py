@@ -0,0 +1,150 @@
+"""
+共享内存中的只读地图表。主进程把障碍物占用位图和建筑物高度图复制到multiprocessing.shared_memory，
+工作进程(进程池搜索、并行对战等)只需要收到很小的spec，按名字attach后得到NumPy视图，不复制数组数据，
+每个工作进程的内存占用与地图大小无关。
+"""
+import sys
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import log
+
+logger = log.get_logger(__name__)
+
+# Python 3.13起SharedMemory可以指定track=False，attach时不向resource_tracker登记
+_HAS_TRACK_ARG = sys.version_info >= (3, 13)
+# 本进程创建的共享内存名字，由创建者的resource_tracker登记，fork出的工作进程继承这个集合
+_created = set()
+
+
+def _attach_shared_memory(name: str):
+    """
+    映射其它进程创建的共享内存，不由本进程的resource_tracker管理。
+    Python 3.13之前attach时也会登记，工作进程退出时tracker会unlink仍在使用的共享内存，
+    attach之后立即取消登记一次(bpo-39959中给出的做法)。
+    创建者自己，以及创建之后才fork、与创建者共用tracker的进程，attach时的登记与创建者的登记相同，不取消。
+    工作进程应在创建者启动tracker之前fork(main在对战开始前创建进程池)：
+    在tracker启动之后、创建这些共享内存之前fork的进程与创建者共用tracker，取消登记会删除创建者的登记
+    """
+    if _HAS_TRACK_ARG:
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if shm._name not in _created:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _unlink(blocks: list):
+    for shm in blocks:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        _created.discard(shm._name)
+
+
+class SharedTables:
+    """
+    一组共享内存中的NumPy数组，按名字访问，数组均为只读。
+    create创建的对象拥有共享内存，close时释放(unlink)；attach得到的对象close时只解除映射。
+    """
+
+    def __init__(self, blocks: dict, layout: dict, owner: bool):
+        self._blocks = blocks
+        self._layout = layout
+        self._owner = owner
+        self._arrays = {}
+        # 创建者没有调用close时在对象回收或进程退出时释放，进程异常退出时由resource_tracker释放
+        self._finalizer = weakref.finalize(self, _unlink, list(blocks.values())) if owner else None
+        for name, (shm_name, shape, dtype) in layout.items():
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[name].buf)
+            array.flags.writeable = False
+            self._arrays[name] = array
+
+    @classmethod
+    def create(cls, arrays: dict):
+        """
+        把数组复制到新建的共享内存
+        :param arrays: {名字: NumPy数组}
+        """
+        blocks, layout = {}, {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                # 长度为0的共享内存不能创建
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks[name] = shm
+                _created.add(shm._name)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                layout[name] = (shm.name, array.shape, array.dtype.str)
+        except BaseException:
+            for shm in blocks.values():
+                shm.close()
+            _unlink(blocks.values())
+            raise
+        return cls(blocks, layout, owner=True)
+
+    @classmethod
+    def attach(cls, spec: dict):
+        """
+        按名字映射其它进程创建的共享内存
+        :param spec: 创建者的spec()
+        """
+        blocks = {}
+        try:
+            for name, (shm_name, shape, dtype) in spec.items():
+                blocks[name] = _attach_shared_memory(shm_name)
+        except BaseException:
+            for shm in blocks.values():
+                shm.close()
+            raise
+        return cls(blocks, dict(spec), owner=False)
+
+    def spec(self):
+        """
+        传给工作进程的描述，可以pickle
+        :return: {名字: (共享内存名字, 形状, dtype字符串)}
+        """
+        return dict(self._layout)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def get(self, name, default=None):
+        return self._arrays.get(name, default)
+
+    def close(self):
+        """解除映射，创建者同时释放共享内存；之后不能再使用取得的数组"""
+        self._arrays = {}
+        blocks, self._blocks = self._blocks, {}
+        for shm in blocks.values():
+            try:
+                shm.close()
+            except BufferError:
+                # 仍有数组引用共享内存，映射在这些数组释放后解除
+                logger.debug('Shared table %s still in use', shm.name)
+        if self._finalizer is not None:
+            self._finalizer()
+
+
+def share_map(map_info):
+    """
+    把地图的静态表放入共享内存
+    'occupancy'为MapGeometry.layer_bits，'tops'为Heightmap.tops。
+    库中的JPSPlus不能导出跳点表，工作进程由占用位图创建搜索对象后仍需自己预处理
+    :param map_info: model.MapInfo对象
+    :return: SharedTables对象
+    """
+    arrays = {'occupancy': map_info.geometry.layer_bits, 'tops': map_info.heightmap.tops}
+    shared = SharedTables.create(arrays)
+    logger.debug('Map tables shared, %d arrays, %d bytes', len(arrays), shared.nbytes)
+    return shared
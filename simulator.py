@@ -0,0 +1,469 @@
+"""
+本地裁判模拟器：使用与recv_judger_data/send_judger_data相同的8位长度头 + json协议，
+生成地图、刷新货物、用简单策略控制敌方无人机，并处理碰撞、取送货、充电和电量规则。
+每一步在收到飞行计划后立即推进，用于在单机上测试完整比赛的吞吐量和超时情况。
+
+用法：
+    python simulator.py --size 100 --uavs 20 --enemies 20 --steps 500 --client
+"""
+import argparse
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from comm import FrameReader
+from codec import loads
+
+DEFAULT_UAV_PRICE = [
+    {'type': 'F1', 'load_weight': 100, 'value': 300, 'capacity': 10000, 'charge': 200},
+    {'type': 'F2', 'load_weight': 50, 'value': 200, 'capacity': 5000, 'charge': 100},
+    {'type': 'F3', 'load_weight': 20, 'value': 100, 'capacity': 2000, 'charge': 50},
+]
+
+
+class SimConfig:
+    """模拟比赛参数，与MapInfo对应"""
+
+    def __init__(self, size=100, height=100, h_low=60, h_high=99, num_buildings=20,
+                 num_fogs=5, num_uavs=10, num_enemies=10, match_steps=500, goods_rate=0.3,
+                 init_value=1000, uav_price=None, seed=0):
+        self.size = size
+        self.height = height
+        self.h_low = h_low
+        self.h_high = h_high
+        self.num_buildings = num_buildings
+        self.num_fogs = num_fogs
+        self.num_uavs = num_uavs
+        self.num_enemies = num_enemies
+        self.match_steps = match_steps
+        self.goods_rate = goods_rate  # 每一步刷新货物的概率
+        self.init_value = init_value
+        self.uav_price = uav_price or DEFAULT_UAV_PRICE
+        self.seed = seed
+
+
+class SimUAV:
+    def __init__(self, no, uav_type, x, y, z, price: dict):
+        self.no = no
+        self.uav_type = uav_type
+        self.x, self.y, self.z = x, y, z
+        self.goods_no = -1
+        self.status = 0
+        self.load_weight = price['load_weight']
+        self.value = price['value']
+        self.capacity = price['capacity']
+        self.charge = price['charge']
+        self.remain_electricity = price['capacity']
+        self.target = None  # 敌方无人机的目标货物编号
+
+    @property
+    def loc(self):
+        return self.x, self.y, self.z
+
+    def to_dict(self, status=None):
+        return {'no': self.no, 'type': self.uav_type, 'x': self.x, 'y': self.y, 'z': self.z,
+                'goods_no': self.goods_no, 'status': self.status if status is None else status,
+                'remain_electricity': self.remain_electricity}
+
+
+class SimGoods:
+    def __init__(self, no, start_x, start_y, end_x, end_y, weight, value, start_time, remain_time):
+        self.no = no
+        self.start_x, self.start_y = start_x, start_y
+        self.end_x, self.end_y = end_x, end_y
+        self.weight = weight
+        self.value = value
+        self.start_time = start_time
+        self.remain_time = remain_time
+        self.left_time = remain_time
+        self.status = 0
+
+    def to_dict(self):
+        return {'no': self.no, 'start_x': self.start_x, 'start_y': self.start_y,
+                'end_x': self.end_x, 'end_y': self.end_y, 'weight': self.weight,
+                'value': self.value, 'start_time': self.start_time,
+                'remain_time': self.remain_time, 'left_time': self.left_time,
+                'status': self.status}
+
+
+def _sign(v):
+    return (v > 0) - (v < 0)
+
+
+class MatchSimulator:
+    """比赛状态和规则"""
+
+    def __init__(self, config: SimConfig, token='simulator'):
+        self.config = config
+        self.token = token
+        self.rng = random.Random(config.seed)
+        self.time = 0
+        self.we_value = config.init_value
+        self.enemy_value = config.init_value
+        self.price = {p['type']: p for p in config.uav_price}
+        self.cheapest = min(config.uav_price, key=lambda p: p['value'])['type']
+
+        size = config.size
+        self.parking = (0, 0)
+        self.enemy_parking = (size - 1, size - 1)
+        # 每个平面坐标上建筑物的最大高度，-1表示没有建筑物
+        self.heightmap = [[-1] * size for _ in range(size)]
+        self.buildings, self.fogs = [], []
+        self._generate_map()
+
+        self.uav_we, self.uav_enemy, self.goods = {}, {}, {}
+        self._next_uav_no = 0
+        self._next_enemy_no = 0
+        self._next_goods_no = 0
+        for _ in range(config.num_uavs):
+            self._add_uav(self.cheapest)
+        for _ in range(config.num_enemies):
+            self._add_enemy(self.cheapest)
+
+        # 已经坠毁的无人机只在下一步的消息中出现一次
+        self._crashed_we, self._crashed_enemy = [], []
+
+    def _generate_map(self):
+        config, rng, size = self.config, self.rng, self.config.size
+        for _ in range(config.num_buildings):
+            l, w = rng.randint(1, max(1, size // 10)), rng.randint(1, max(1, size // 10))
+            x, y = rng.randint(2, size - l - 2), rng.randint(2, size - w - 2)
+            h = rng.randint(config.h_low // 2, config.h_high - 1)
+            self.buildings.append({'x': x, 'y': y, 'l': l, 'w': w, 'h': h})
+            for i in range(x, x + l):
+                for j in range(y, y + w):
+                    self.heightmap[i][j] = max(self.heightmap[i][j], h)
+        for _ in range(config.num_fogs):
+            l, w = rng.randint(1, max(1, size // 5)), rng.randint(1, max(1, size // 5))
+            x, y = rng.randint(0, size - l), rng.randint(0, size - w)
+            b = rng.randint(0, config.h_high - 1)
+            self.fogs.append({'x': x, 'y': y, 'l': l, 'w': w, 'b': b,
+                              't': rng.randint(b, config.h_high)})
+
+    def map_dict(self):
+        """对战开始时发送的地图消息中的map字段"""
+        return {'map': {'x': self.config.size, 'y': self.config.size, 'z': self.config.height},
+                'parking': {'x': self.parking[0], 'y': self.parking[1]},
+                'h_low': self.config.h_low,
+                'h_high': self.config.h_high,
+                'building': self.buildings,
+                'fog': self.fogs,
+                'init_UAV': [dict(u.to_dict(), load_weight=u.load_weight) for u in self.uav_we.values()],
+                'UAV_price': self.config.uav_price}
+
+    def _add_uav(self, uav_type):
+        uav = SimUAV(self._next_uav_no, uav_type, self.parking[0], self.parking[1], 0,
+                     self.price[uav_type])
+        self.uav_we[uav.no] = uav
+        self._next_uav_no += 1
+
+    def _add_enemy(self, uav_type):
+        uav = SimUAV(self._next_enemy_no, uav_type, self.enemy_parking[0], self.enemy_parking[1], 0,
+                     self.price[uav_type])
+        self.uav_enemy[uav.no] = uav
+        self._next_enemy_no += 1
+
+    def _blocked(self, x, y, z):
+        size = self.config.size
+        if not (0 <= x < size and 0 <= y < size and 0 <= z <= self.config.h_high):
+            return True
+        return z <= self.heightmap[x][y]
+
+    def _in_fog(self, x, y, z):
+        for f in self.fogs:
+            if f['x'] <= x < f['x'] + f['l'] and f['y'] <= y < f['y'] + f['w'] and \
+                    f['b'] <= z <= f['t']:
+                return True
+        return False
+
+    def _free_ground(self):
+        size = self.config.size
+        while True:
+            x, y = self.rng.randrange(size), self.rng.randrange(size)
+            if self.heightmap[x][y] < 0 and (x, y) != self.parking and (x, y) != self.enemy_parking:
+                return x, y
+
+    def _spawn_goods(self):
+        if self.rng.random() >= self.config.goods_rate:
+            return
+        (sx, sy), (ex, ey) = self._free_ground(), self._free_ground()
+        max_weight = max(p['load_weight'] for p in self.config.uav_price)
+        dist = abs(sx - ex) + abs(sy - ey)
+        goods = SimGoods(self._next_goods_no, sx, sy, ex, ey,
+                         weight=self.rng.randint(1, max_weight),
+                         value=dist * self.rng.randint(1, 5) + 10,
+                         start_time=self.time,
+                         remain_time=self.config.h_low * 2 + self.rng.randint(dist, dist * 2 + 10))
+        self.goods[goods.no] = goods
+        self._next_goods_no += 1
+
+    def _valid_move(self, uav: SimUAV, x, y, z):
+        dx, dy, dz = x - uav.x, y - uav.y, z - uav.z
+        if max(abs(dx), abs(dy), abs(dz)) > 1:
+            return False
+        if (dx or dy) and (dz or uav.z < self.config.h_low):
+            # 不能同时水平和垂直移动，低于最低飞行高度时只能垂直移动
+            return False
+        if (x, y) in (self.parking, self.enemy_parking) and z == 0:
+            return True
+        return not self._blocked(x, y, z)
+
+    def _enemy_next(self, uav: SimUAV):
+        """敌方无人机策略：取最近的可搬运货物，飞到最低飞行高度后直线飞行"""
+        if uav.goods_no == -1 and (uav.target not in self.goods or
+                                   self.goods[uav.target].status != 0):
+            claimed = {u.target for u in self.uav_enemy.values()}
+            candidates = [g for g in self.goods.values() if g.status == 0 and g.no not in claimed and
+                          g.weight <= uav.load_weight and g.weight <= uav.remain_electricity]
+            uav.target = min(candidates, key=lambda g: abs(g.start_x - uav.x) + abs(g.start_y - uav.y),
+                             default=None)
+            uav.target = uav.target.no if uav.target else None
+        if uav.goods_no != -1:
+            goods = self.goods[uav.goods_no]
+            tx, ty = goods.end_x, goods.end_y
+        elif uav.target is not None:
+            goods = self.goods[uav.target]
+            tx, ty = goods.start_x, goods.start_y
+        else:
+            tx, ty = self.enemy_parking
+
+        if (uav.x, uav.y) == (tx, ty):
+            return uav.x, uav.y, max(0, uav.z - 1)
+        if uav.z < self.config.h_low:
+            return uav.x, uav.y, uav.z + 1
+        nx, ny = uav.x + _sign(tx - uav.x), uav.y + _sign(ty - uav.y)
+        if not self._blocked(nx, ny, uav.z):
+            return nx, ny, uav.z
+        return uav.x, uav.y, min(self.config.h_high, uav.z + 1)
+
+    def _crash(self, uavs: dict, crashed: list, no):
+        uav = uavs.pop(no)
+        uav.status = 1
+        if uav.goods_no in self.goods:
+            # 坠毁时携带的货物消失
+            self.goods.pop(uav.goods_no)
+        crashed.append(uav)
+
+    def step(self, plan: dict):
+        """
+        根据选手发送的飞行计划推进一步
+        :param plan: flyPlane消息
+        """
+        self.time += 1
+        self._crashed_we, self._crashed_enemy = [], []
+
+        # 选手无人机移动，非法移动直接坠毁
+        moves = {}
+        claims = {}  # 选手无人机申请拾取的货物编号
+        for info in plan.get('UAV_info', []):
+            uav = self.uav_we.get(info['no'])
+            if uav is None:
+                continue
+            claims[uav.no] = info.get('goods_no', -1)
+            target = (info['x'], info['y'], info['z'])
+            if not self._valid_move(uav, *target):
+                self._crash(self.uav_we, self._crashed_we, uav.no)
+                continue
+            moves[uav.no] = target
+
+        enemy_moves = {no: self._enemy_next(u) for no, u in self.uav_enemy.items()}
+
+        # 碰撞检测：同一位置或者交换位置的无人机全部坠毁，停机坪地面除外
+        old_pos = {}
+        new_pos = {}
+        for side, uavs, side_moves in (('we', self.uav_we, moves), ('enemy', self.uav_enemy, enemy_moves)):
+            for no, uav in uavs.items():
+                old_pos[(side, no)] = uav.loc
+                new_pos[(side, no)] = side_moves.get(no, uav.loc)
+        occupied = {}
+        for key, pos in new_pos.items():
+            if pos[2] == 0 and pos[:2] in (self.parking, self.enemy_parking):
+                continue
+            occupied.setdefault(pos, []).append(key)
+        crashed = {key for keys in occupied.values() if len(keys) > 1 for key in keys}
+        by_old = {pos: key for key, pos in old_pos.items()}
+        for key, pos in new_pos.items():
+            other = by_old.get(pos)
+            if other and other != key and new_pos[other] == old_pos[key] and pos != old_pos[key]:
+                crashed.update((key, other))
+
+        for side, no in crashed:
+            if side == 'we':
+                self._crash(self.uav_we, self._crashed_we, no)
+            else:
+                self._crash(self.uav_enemy, self._crashed_enemy, no)
+
+        for side, uavs, value_attr in (('we', self.uav_we, 'we_value'),
+                                       ('enemy', self.uav_enemy, 'enemy_value')):
+            for no, uav in uavs.items():
+                uav.x, uav.y, uav.z = new_pos[(side, no)]
+                claim = claims.get(no, -1) if side == 'we' else uav.target
+                self._apply_goods_rules(uav, value_attr, claim)
+
+        # 货物倒计时
+        for goods in list(self.goods.values()):
+            if goods.status == 0:
+                goods.left_time -= 1
+                if goods.left_time <= 0:
+                    self.goods.pop(goods.no)
+        self._spawn_goods()
+
+        # 购买无人机
+        for p in plan.get('purchase_UAV') or []:
+            price = self.price.get(p.get('purchase'))
+            if price and self.we_value >= price['value']:
+                self.we_value -= price['value']
+                self._add_uav(price['type'])
+        if self.enemy_value >= self.price[self.cheapest]['value'] * 2:
+            self.enemy_value -= self.price[self.cheapest]['value']
+            self._add_enemy(self.cheapest)
+
+    def _apply_goods_rules(self, uav: SimUAV, value_attr: str, claim=-1):
+        """
+        取货、送货、耗电和充电规则
+        :param claim: 申请拾取的货物编号，只有处于该货物出现点地面时才能拾取
+        """
+        home = self.parking if value_attr == 'we_value' else self.enemy_parking
+        if uav.goods_no != -1:
+            goods = self.goods.get(uav.goods_no)
+            if goods is None:
+                uav.goods_no = -1
+            elif uav.remain_electricity < goods.weight:
+                # 电量不足，货物掉落消失
+                self.goods.pop(goods.no)
+                uav.goods_no = -1
+            else:
+                uav.remain_electricity -= goods.weight
+                if (uav.x, uav.y, uav.z) == (goods.end_x, goods.end_y, 0):
+                    setattr(self, value_attr, getattr(self, value_attr) + goods.value)
+                    self.goods.pop(goods.no)
+                    uav.goods_no = -1
+                    uav.target = None
+        elif uav.z == 0 and claim is not None and claim in self.goods:
+            goods = self.goods[claim]
+            if goods.status == 0 and (goods.start_x, goods.start_y) == (uav.x, uav.y) and \
+                    goods.weight <= uav.load_weight and goods.weight <= uav.remain_electricity:
+                goods.status = 1
+                uav.goods_no = goods.no
+        if (uav.x, uav.y, uav.z) == (home[0], home[1], 0):
+            uav.remain_electricity = min(uav.capacity, uav.remain_electricity + uav.charge)
+
+    def status_dict(self):
+        """每一步发送给选手的对战信息"""
+        enemies = []
+        for u in self.uav_enemy.values():
+            enemies.append(u.to_dict(status=2 if self._in_fog(u.x, u.y, u.z) else None))
+        enemies += [u.to_dict() for u in self._crashed_enemy]
+        return {'token': self.token,
+                'notice': 'step',
+                'match_status': 1 if self.finished else 0,
+                'time': self.time,
+                'UAV_we': [u.to_dict() for u in self.uav_we.values()] +
+                          [u.to_dict() for u in self._crashed_we],
+                'we_value': self.we_value,
+                'UAV_enemy': enemies,
+                'enemy_value': self.enemy_value,
+                'goods': [g.to_dict() for g in self.goods.values()]}
+
+    @property
+    def finished(self):
+        return self.time >= self.config.match_steps or not self.uav_we
+
+
+def _send(conn, msg: dict):
+    body = json.dumps(msg).encode()
+    conn.sendall(b'%08d' % len(body) + body)
+
+
+def serve_match(listener: socket.socket, config: SimConfig, budget=1.0):
+    """
+    等待一个选手连接并完成一场比赛
+    :return: 统计信息字典
+    """
+    conn, _ = listener.accept()
+    reader = FrameReader(conn)
+    sim = MatchSimulator(config)
+
+    _send(conn, {'notice': 'connected'})
+    token = loads(reader.read_frame())['token']
+    sim.token = token
+    _send(conn, {'token': token, 'notice': 'tokenresult', 'result': 0})
+    loads(reader.read_frame())  # ready
+    _send(conn, {'token': token, 'notice': 'sendmap', 'map': sim.map_dict()})
+
+    think_times = []
+    match_start = time.perf_counter()
+    while True:
+        send_time = time.perf_counter()
+        frame = reader.read_frame()
+        if frame is None:
+            break
+        think_times.append(time.perf_counter() - send_time)
+        sim.step(loads(frame))
+        _send(conn, sim.status_dict())
+        if sim.finished:
+            break
+    elapsed = time.perf_counter() - match_start
+    conn.close()
+
+    think_times.sort()
+    return {'steps': sim.time,
+            'steps_per_second': sim.time / elapsed if elapsed else 0,
+            'timeouts': sum(1 for t in think_times if t >= budget),
+            'max_step_time': think_times[-1] if think_times else 0,
+            'mean_step_time': sum(think_times) / len(think_times) if think_times else 0,
+            'we_value': sim.we_value,
+            'enemy_value': sim.enemy_value,
+            'uav_we': len(sim.uav_we),
+            'uav_enemy': len(sim.uav_enemy)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local judger simulator.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--height', type=int, default=100)
+    parser.add_argument('--h-low', type=int, default=60)
+    parser.add_argument('--h-high', type=int, default=99)
+    parser.add_argument('--buildings', type=int, default=20)
+    parser.add_argument('--fogs', type=int, default=5)
+    parser.add_argument('--uavs', type=int, default=10)
+    parser.add_argument('--enemies', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--goods-rate', type=float, default=0.3)
+    parser.add_argument('--budget', type=float, default=1.0)
+    parser.add_argument('--matches', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--client', action='store_true', help='start main.main in a subprocess per match')
+    args = parser.parse_args()
+
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(1)
+    host, port = listener.getsockname()
+    print('Simulator listening on %s:%d' % (host, port))
+
+    for i in range(args.matches):
+        config = SimConfig(size=args.size, height=args.height, h_low=args.h_low, h_high=args.h_high,
+                           num_buildings=args.buildings, num_fogs=args.fogs, num_uavs=args.uavs,
+                           num_enemies=args.enemies, match_steps=args.steps,
+                           goods_rate=args.goods_rate, seed=args.seed + i)
+        client = None
+        if args.client:
+            client = subprocess.Popen(
+                [sys.executable, '-c', 'import main; main.main(%r, %d, "simulator")' % (host, port)])
+        stats = serve_match(listener, config, args.budget)
+        if client:
+            client.wait()
+        print('Match %d: %s' % (i, ' '.join('%s=%s' % kv for kv in stats.items())))
+
+    listener.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import numpy as np
+
+
+class VoxelIndex:
+    """
+    任意立方体集合的位压缩三维索引，每个格子占1位，沿z方向打包。
+    boxes格式与MapInfo.buildings相同: [(x1, y1, x2, y2, z1, z2), ...]，闭区间。
+    """
+
+    def __init__(self, width: int, depth: int, height: int, boxes: list):
+        """
+        :param width: x方向格子数
+        :param depth: y方向格子数
+        :param height: z方向格子数
+        """
+        self.width, self.depth, self.height = width, depth, height
+        mask = np.zeros((width, depth, height), dtype=bool)
+        for x1, y1, x2, y2, z1, z2 in boxes:
+            mask[max(x1, 0):x2 + 1, max(y1, 0):y2 + 1, max(z1, 0):z2 + 1] = True
+        self.bits = np.packbits(mask, axis=2)  # (width, depth, ceil(height / 8))
+        self._stride = self.bits.shape[2]
+        # 标量查询使用bytes，避免NumPy标量索引的开销
+        self._bytes = self.bits.tobytes()
+
+    def contains(self, x, y, z):
+        """(x, y, z)是否在某个立方体内，超出范围时返回False"""
+        if 0 <= x < self.width and 0 <= y < self.depth and 0 <= z < self.height:
+            return (self._bytes[(x * self.depth + y) * self._stride + (z >> 3)] >> (7 - (z & 7))) & 1 == 1
+        return False
+
+    def column(self, x, y):
+        """(x, y)上方每一层是否被占用，bool数组"""
+        return np.unpackbits(self.bits[x, y], count=self.height).astype(bool)
+
+    def layer(self, z):
+        """高度z的平面占用情况，(width, depth)的bool数组"""
+        return ((self.bits[:, :, z >> 3] >> (7 - (z & 7))) & 1).astype(bool)
+
+    def contains_many(self, xs, ys, zs):
+        """批量查询，参数为整数数组，返回bool数组"""
+        xs, ys, zs = np.asarray(xs), np.asarray(ys), np.asarray(zs)
+        valid = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.depth) & (zs >= 0) & (zs < self.height)
+        result = np.zeros(xs.shape, dtype=bool)
+        x, y, z = xs[valid], ys[valid], zs[valid]
+        result[valid] = (self.bits[x, y, z >> 3] >> (7 - (z & 7))) & 1 == 1
+        return result
+
+
+class Heightmap:
+    """
+    建筑物高度图。比赛中的建筑物都从地面(z=0)开始，每个平面坐标只需要记录最高的建筑物顶部高度，
+    障碍物判断变为 z <= tops[x][y]，与建筑物数量无关；不从地面开始的立方体放入可选的VoxelIndex。
+    """
+
+    def __init__(self, width: int, depth: int, buildings: list, height: int = None):
+        """
+        :param width: x方向格子数
+        :param depth: y方向格子数
+        :param buildings: [(x1, y1, x2, y2, z1, z2), ...]，同MapInfo.buildings
+        :param height: z方向格子数，只在存在不从地面开始的立方体时使用，默认为最高顶部 + 1
+        """
+        self.width, self.depth = width, depth
+        self.tops = np.full((width, depth), -1, dtype=np.int32)  # 没有建筑物为-1
+        floating = []
+        for box in buildings:
+            x1, y1, x2, y2, z1, z2 = box
+            if z1 > 0:
+                floating.append(box)
+                continue
+            view = self.tops[max(x1, 0):x2 + 1, max(y1, 0):y2 + 1]
+            np.maximum(view, z2, out=view)
+
+        self.voxels = None
+        if floating:
+            if height is None:
+                height = max(b[-1] for b in floating) + 1
+            self.voxels = VoxelIndex(width, depth, height, floating)
+
+        # 标量查询使用嵌套列表，避免NumPy标量索引的开销
+        self._rows = self.tops.tolist()
+
+    def top(self, x, y):
+        """(x, y)处建筑物顶部高度，没有建筑物为-1"""
+        return self._rows[x][y]
+
+    def is_blocked(self, x, y, z):
+        """(x, y, z)是否和建筑物重叠，(x, y)必须在地图范围内"""
+        if z <= self._rows[x][y]:
+            return True
+        return self.voxels is not None and self.voxels.contains(x, y, z)
+
+    def is_blocked_coord(self, c):
+        return self.is_blocked(c.x, c.y, c.z)
+
+    def free_mask(self, z):
+        """高度z的平面内可以通行的格子，(width, depth)的bool数组"""
+        mask = self.tops < z
+        if self.voxels is not None and z < self.voxels.height:
+            mask &= ~self.voxels.layer(z)
+        return mask
+
+    def is_blocked_many(self, xs, ys, zs):
+        """批量查询，参数为地图范围内的整数数组，返回bool数组"""
+        xs, ys, zs = np.asarray(xs), np.asarray(ys), np.asarray(zs)
+        result = zs <= self.tops[xs, ys]
+        if self.voxels is not None:
+            result |= self.voxels.contains_many(xs, ys, zs)
+        return result
+
+
+class FogIndex:
+    """
+    雾区索引，基于位压缩的三维掩码：单点查询O(1)，路径查询O(路径长度)，并提供批量查询。
+    """
+
+    def __init__(self, width: int, depth: int, height: int, fogs: list):
+        """
+        :param fogs: [(x1, y1, x2, y2, z1, z2), ...]，同MapInfo.fogs
+        """
+        self.fogs = fogs
+        self.voxels = VoxelIndex(width, depth, height, fogs)
+        # 每个平面坐标上方是否存在雾区，用于快速排除
+        self._has_fog = self.voxels.bits.any(axis=2).tolist()
+
+    def __bool__(self):
+        return len(self.fogs) > 0
+
+    def in_fog(self, x, y, z):
+        """(x, y, z)是否处于雾区"""
+        if 0 <= x < self.voxels.width and 0 <= y < self.voxels.depth and self._has_fog[x][y]:
+            return self.voxels.contains(x, y, z)
+        return False
+
+    def coord_in_fog(self, c):
+        return self.in_fog(c.x, c.y, c.z)
+
+    def path_in_fog(self, path: list):
+        """
+        路径上处于雾区的坐标序号
+        :param path: Coordinate列表
+        :return: [序号, ...]
+        """
+        in_fog = self.in_fog
+        return [i for i, c in enumerate(path) if in_fog(c.x, c.y, c.z)]
+
+    def in_fog_many(self, xs, ys, zs):
+        """批量查询，参数为整数数组，返回bool数组"""
+        return self.voxels.contains_many(xs, ys, zs)
+
+
+class MapGeometry:
+    """
+    由MapInfo推导的静态数据，对战开始时计算一次，所有Agent共享，创建后不再修改(数组均为只读)。
+    """
+
+    def __init__(self, map_info, cache=None):
+        """
+        :param map_info: model.MapInfo对象
+        :param cache: map_cache.MapCache对象，不为None时占用位图和可通行格子从磁盘缓存加载，
+                      缓存中没有的地图计算后写入缓存
+        """
+        self.width = map_info.map_range.x + 1
+        self.depth = map_info.map_range.y + 1
+        self.height = map_info.map_range.z + 1
+        self.heightmap = map_info.heightmap
+
+        # 路径搜索高度：h_low和比h_low高的建筑物顶部 + 1，从低到高排序
+        # 在一个高度搜索不到路径时，尝试下一个高度
+        self.search_heights = tuple(sorted(set(
+            [map_info.h_low] + [b[-1] + 1 for b in map_info.buildings
+                                if map_info.h_low < b[-1] < map_info.h_high])))
+
+        # 停机坪上方垂直方向的坐标，从地面到h_high
+        parking = map_info.parking
+        self.parking_column = tuple(map_info.coords.get(parking.x, parking.y, z)
+                                    for z in range(map_info.h_high + 1))
+
+        entry = cache.entry(map_info) if cache is not None else None
+
+        # 每一层的障碍物占用位图，(高度, x, 按y打包的字节)
+        if entry is not None:
+            self.layer_bits = entry.get_or_build('occupancy', self._build_layer_bits)
+        else:
+            self.layer_bits = self._build_layer_bits()
+        self.layer_bits.flags.writeable = False
+
+        # 搜索高度平面内可以通行的格子坐标
+        self._free_cells = {}
+        if entry is None or not self._load_free_cells(entry):
+            for z in self.search_heights:
+                self.free_cells(z)
+            if entry is not None:
+                self._save_free_cells(entry)
+
+    def _build_layer_bits(self):
+        occupied = np.stack([~self.heightmap.free_mask(z) for z in range(self.height)])
+        return np.packbits(occupied, axis=2)
+
+    def _load_free_cells(self, entry):
+        """
+        从缓存加载全部搜索高度的可通行格子
+        缓存为'free_cells'((2, 格子总数)，依次为各个搜索高度的xs和ys)和'free_offsets'(每个搜索高度的起止位置)
+        :return: 缓存不存在或与地图不匹配时返回False
+        """
+        cells, offsets = entry.load('free_cells'), entry.load('free_offsets')
+        if cells is None or offsets is None or len(offsets) != len(self.search_heights) + 1 or \
+                cells.ndim != 2 or cells.shape[1] != offsets[-1]:
+            return False
+        offsets = offsets.tolist()
+        for i, z in enumerate(self.search_heights):
+            self._free_cells[z] = (cells[0, offsets[i]:offsets[i + 1]], cells[1, offsets[i]:offsets[i + 1]])
+        return True
+
+    def _save_free_cells(self, entry):
+        cells = [self._free_cells[z] for z in self.search_heights]
+        offsets = np.cumsum([0] + [len(xs) for xs, _ in cells])
+        # 先写格子再写位置，只写入了格子时加载会因为位置不匹配而重新计算
+        entry.save('free_cells', np.concatenate([np.stack(c) for c in cells], axis=1))
+        entry.save('free_offsets', offsets)
+
+    def occupancy(self, z):
+        """高度z的平面内被建筑物占用的格子，(width, depth)的bool数组"""
+        return np.unpackbits(self.layer_bits[z], axis=1, count=self.depth).astype(bool)
+
+    def free_cells(self, z):
+        """
+        高度z的平面内可以通行的格子坐标
+        :return: (xs, ys)，只读的整数数组
+        """
+        cells = self._free_cells.get(z)
+        if cells is None:
+            xs, ys = np.nonzero(self.heightmap.free_mask(z))
+            xs.flags.writeable = False
+            ys.flags.writeable = False
+            cells = self._free_cells[z] = (xs, ys)
+        return cells
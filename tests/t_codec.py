@@ -0,0 +1,145 @@
+import copy
+import json
+import os
+import time
+
+import codec
+from env import env
+from model import MapInfo, StepInfo, UAVStatus
+from scheduler import validate_data
+from world import WorldState
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def _load_map_info():
+    with open(os.path.join(DATA_DIR, 'map_info.json')) as f:
+        map_dict = json.load(f)
+    # 初赛数据没有电量相关字段，补充默认值
+    for price in map_dict['UAV_price']:
+        price.setdefault('capacity', 1000)
+        price.setdefault('charge', 50)
+    for uav in map_dict['init_UAV']:
+        uav.setdefault('remain_electricity', 0)
+    return MapInfo.from_dict(map_dict)
+
+
+def _scaled_step_frame(num):
+    """把step_info.json中的无人机和货物扩充到num个"""
+    with open(os.path.join(DATA_DIR, 'step_info.json')) as f:
+        step_dict = json.load(f)
+
+    def _scale(items):
+        result = []
+        for i in range(num):
+            item = dict(items[i % len(items)])
+            item['no'] = i
+            item.setdefault('remain_electricity', 100)
+            item.setdefault('left_time', 50)
+            result.append(item)
+        return result
+
+    step_dict['UAV_we'] = _scale(step_dict['UAV_we'])
+    step_dict['UAV_enemy'] = _scale(step_dict['UAV_enemy'])
+    step_dict['goods'] = _scale(step_dict['goods'])
+    return json.dumps(step_dict).encode()
+
+
+def _test_step_decoder_validation():
+    print("Testing `StepDecoder` validation...")
+
+    map_info = _load_map_info()
+    frame = _scaled_step_frame(20)
+    expected = StepInfo.from_dict(json.loads(frame), map_info)
+    result = codec.StepDecoder(map_info).decode(frame)
+
+    def _uav_fields(uav):
+        return (uav.no, uav.loc.x, uav.loc.y, uav.loc.z, uav.goods_no, uav.uav_type, uav.status,
+                uav.remain_electricity, uav.price, uav.load_weight, uav.capacity, uav.charge)
+
+    def _goods_fields(g):
+        return (g.no, g.start.x, g.start.y, g.end.x, g.end.y, g.weight, g.value,
+                g.start_time, g.remain_time, g.left_time, g.state)
+
+    assert result.time == expected.time and result.we_value == expected.we_value
+    for attr in ('uav_we', 'uav_enemy'):
+        assert [_uav_fields(u) for u in getattr(result, attr).values()] == \
+               [_uav_fields(u) for u in getattr(expected, attr).values()]
+    assert [_goods_fields(g) for g in result.goods.values()] == \
+           [_goods_fields(g) for g in expected.goods.values()]
+
+    # WorldState使用StepDecoder构造新出现的对象
+    state = WorldState(map_info).apply_frame(frame)
+    assert [_uav_fields(u) for u in state.uav_we.values()] == [_uav_fields(u) for u in result.uav_we.values()]
+    assert [_goods_fields(g) for g in state.goods.values()] == [_goods_fields(g) for g in result.goods.values()]
+    print("Decoded StepInfo matches `StepInfo.from_dict`.\n")
+
+
+def _test_world_state_agent_sync():
+    print("Testing Agent sync from `WorldState`...")
+
+    map_info = _load_map_info()
+    frame = _scaled_step_frame(20)
+    state = WorldState(map_info)
+    env.agents.clear()
+    expected = {}  # 每一步都调用update_uav_info得到的无人机信息
+
+    def _uav_fields(uav):
+        return uav.loc, uav.goods_no, uav.status, uav.remain_electricity
+
+    # 服务器每一步发送相同的信息，电量不变；Agent在两步之间修改本地的位置、载货编号和电量
+    for step in range(5):
+        step_info = state.apply_frame(frame)
+        validate_data(map_info, step_info, set())
+        env.fleet.sync(env.agents)
+        for uav in step_info.uav_we.values():
+            if uav.status != UAVStatus.CRASHED:
+                expected.setdefault(uav.no, copy.copy(uav)).assign(uav)
+        for no, agent in env.agents.items():
+            assert _uav_fields(agent.uav) == _uav_fields(expected[no]), (step, no)
+            for uav in (agent.uav, expected[no]):
+                uav.loc = map_info.coords.get(uav.loc.x, uav.loc.y, uav.loc.z + 1)
+                uav.goods_no = -1 if step % 2 else step
+                uav.remain_electricity -= 1
+            agent.next_step = agent.uav.loc
+        # env.fleet的行在Agent赋值时更新，不需要再次sync
+        fleet = env.fleet
+        for agent in env.agents.values():
+            row, uav = agent.row, agent.uav
+            assert (fleet.x[row], fleet.y[row], fleet.z[row]) == (uav.loc.x, uav.loc.y, uav.loc.z)
+            assert (fleet.goods_no[row], fleet.remain_electricity[row]) == (uav.goods_no, uav.remain_electricity)
+            assert fleet.has_next[row] and fleet.next_z[row] == uav.loc.z
+    env.agents.clear()
+    env.fleet.sync(env.agents)
+    print("Agents match unconditional `update_uav_info`, fleet rows follow the agents.\n")
+
+
+def _test_step_decoder_performance():
+    print("Testing `StepDecoder` performance, fast json backend: %s" % (codec._fast_json is not None))
+
+    map_info = _load_map_info()
+    decoder = codec.StepDecoder(map_info)
+    rounds = 50
+
+    for num in (10, 100, 500, 1000):
+        frame = _scaled_step_frame(num)
+
+        time_start = time.time()
+        for _ in range(rounds):
+            StepInfo.from_dict(json.loads(frame), map_info)
+        base_time = (time.time() - time_start) / rounds
+
+        time_start = time.time()
+        for _ in range(rounds):
+            decoder.decode(frame)
+        decode_time = (time.time() - time_start) / rounds
+
+        print("UAV/goods %d, frame %d bytes, loads + from_dict %f s, StepDecoder %f s" %
+              (num, len(frame), base_time, decode_time))
+    print()
+
+
+if __name__ == '__main__':
+    _test_step_decoder_validation()
+    _test_world_state_agent_sync()
+    _test_step_decoder_performance()
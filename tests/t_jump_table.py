@@ -0,0 +1,42 @@
+import os
+import time
+
+import numpy as np
+
+import jump_table
+from jpsp_python.bridge import xy_to_point
+from jpsp_python.jps import JPS, Point
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jpsgb_map')
+
+for name in ['maze-100-1', 'random-100-33', 'room-100-10']:
+    map_path = os.path.join(data_dir, name + '.map')
+
+    blocked = jump_table.read_movingai_map(map_path)
+
+    rows, cols = blocked.shape
+    obstacles = [Point(row, col) for row, col in zip(*np.nonzero(blocked))]
+
+    start = time.time()
+    jps = JPS(width=cols, height=rows, obstacles=obstacles)
+    jps.preprocess()
+    print("%s: preprocess finished, time %s" % (name, time.time() - start))
+
+    # 导出后导入到新的对象，路径应该完全相同
+    table = jps.export_tables()
+    start = time.time()
+    imported = JPS(width=cols, height=rows, obstacles=[])
+    assert imported.import_tables(table)
+    print("Tables imported, time %s" % (time.time() - start))
+    assert (imported.export_tables() == table).all()
+    assert ((table[..., jump_table.FLAGS] & jump_table.FLAG_OBSTACLE != 0) == blocked).all()
+
+    free = list(zip(*np.nonzero(~blocked)))
+    np.random.seed(0)
+    for _ in range(20):
+        (r1, c1), (r2, c2) = [free[i] for i in np.random.randint(len(free), size=2)]
+        path1 = jps.get_path(xy_to_point(c1, r1), xy_to_point(c2, r2))
+        path2 = imported.get_path(xy_to_point(c1, r1), xy_to_point(c2, r2))
+        assert [(p.row, p.col) for p in path1] == [(p.row, p.col) for p in path2]
+
+    print()
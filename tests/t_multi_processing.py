@@ -1,6 +1,14 @@
+import json
 import multiprocessing
+import os
 import time
 
+import numpy as np
+
+from jpsp_c_api import jpsp_bridge as bridge
+from model import MapInfo
+from plan_pool import PlanPool
+
 
 def f(x):
     for _ in range(100000000):
@@ -49,6 +57,39 @@ if __name__ == "__main__":
 
     print("Sub-process(es) done. time %s" % (end - start))
 
+    # 进程池路径搜索，与本进程中的搜索结果比较
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'map_info.json')) as f:
+        map_dict = json.load(f)
+    for price in map_dict['UAV_price']:
+        price.setdefault('capacity', 1000)
+        price.setdefault('charge', 50)
+    for uav in map_dict['init_UAV']:
+        uav.setdefault('remain_electricity', 0)
+    map_info = MapInfo.from_dict(map_dict)
+    search_height = map_info.geometry.search_heights[0]
+    finder = bridge.JPSPlus(map_info.map_range.x + 1, map_info.map_range.y + 1,
+                            occupancy=map_info.geometry.occupancy(search_height))
+    finder.preprocess()
+
+    xs, ys = map_info.geometry.free_cells(search_height)
+    np.random.seed(0)
+    ends = np.random.randint(len(xs), size=(256, 2))
+    queries = np.stack([xs[ends[:, 0]], ys[ends[:, 0]], xs[ends[:, 1]], ys[ends[:, 1]]], axis=1)
+
+    plan_pool = PlanPool(pool, map_info, 8)
+    chunks = np.array_split(np.arange(len(queries)), 8)
+    plan_pool.get_paths(search_height, queries[:8], [[i] for i in range(8)])  # 等待工作进程预处理
+    start = time.time()
+    batches = plan_pool.get_paths(search_height, queries, chunks)
+    print("Process pool search %d paths, time %s" % (len(queries), time.time() - start))
+    start = time.time()
+    local = finder.collect_paths(queries)
+    print("Local search %d paths, time %s" % (len(queries), time.time() - start))
+    for batch, rows in zip(batches, chunks):
+        for j, i in enumerate(rows):
+            assert (batch[j] == local[i]).all()
+    plan_pool.close()
+
 # if __name__ == '__main__':
 #     cores = multiprocessing.cpu_count()
 #     pool = multiprocessing.Pool(processes=cores)
@@ -0,0 +1,60 @@
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from model import MapInfo
+from shared_tables import SharedTables, share_map
+
+
+def checksum(spec):
+    # 工作进程按名字映射，数组数据不经过pickle
+    tables = SharedTables.attach(spec)
+    result = {name: int(tables[name].astype(np.int64).sum()) for name in spec}
+    tables.close()
+    return result
+
+
+if __name__ == "__main__":
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'map_info.json')) as f:
+        map_dict = json.load(f)
+    for price in map_dict['UAV_price']:
+        price.setdefault('capacity', 1000)
+        price.setdefault('charge', 50)
+    for uav in map_dict['init_UAV']:
+        uav.setdefault('remain_electricity', 0)
+    map_info = MapInfo.from_dict(map_dict)
+
+    # 同main，进程池在共享之前创建，工作进程使用各自的resource_tracker
+    pool = multiprocessing.Pool(processes=4)
+    start = time.time()
+    shared = share_map(map_info)
+    print("Map tables shared, %d bytes, time %s" % (shared.nbytes, time.time() - start))
+    assert (shared['occupancy'] == map_info.geometry.layer_bits).all()
+    assert (shared['tops'] == map_info.heightmap.tops).all()
+
+    expected = checksum(shared.spec())
+    start = time.time()
+    for result in pool.map(checksum, [shared.spec()] * 8):
+        assert result == expected
+    print("Attached in workers, time %s" % (time.time() - start))
+    pool.close()
+    pool.join()
+    # 工作进程退出后，它们的tracker不能释放仍在使用的共享内存
+    time.sleep(0.5)
+    assert checksum(shared.spec()) == expected
+
+    # 共享之后创建的进程池与创建者共用tracker
+    pool = multiprocessing.Pool(processes=4)
+    for result in pool.map(checksum, [shared.spec()] * 8):
+        assert result == expected
+    pool.terminate()
+
+    shared.close()
+    try:
+        SharedTables.attach(shared.spec())
+        assert False, 'tables should be released'
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,98 @@
+import numpy as np
+
+from env import env
+from model import MapInfo, StepInfo, UAV, UAVStatus
+from route_plan import Agent, TaskType
+from scheduler import attack_enemy
+from simulator import MatchSimulator, SimConfig
+
+
+def _map_info():
+    map_dict = MatchSimulator(SimConfig(size=40, height=30, h_low=10, h_high=29, num_buildings=10,
+                                        num_fogs=8)).map_dict()
+    for uav in map_dict['init_UAV']:
+        uav.setdefault('remain_electricity', 0)
+    return MapInfo.from_dict(map_dict)
+
+
+def _in_fog_linear(fogs, x, y, z):
+    return any(x1 <= x <= x2 and y1 <= y <= y2 and z1 <= z <= z2 for x1, y1, x2, y2, z1, z2 in fogs)
+
+
+def _test_fog_index():
+    print("Testing `FogIndex` against a linear scan of the fog boxes...")
+
+    map_info = _map_info()
+    fog_index = map_info.fog_index
+    rng = np.random.RandomState(0)
+    r = map_info.map_range
+    # 包括地图范围外的坐标
+    xs = rng.randint(-2, r.x + 3, size=20000)
+    ys = rng.randint(-2, r.y + 3, size=20000)
+    zs = rng.randint(-2, r.z + 3, size=20000)
+    expected = np.array([_in_fog_linear(map_info.fogs, x, y, z) for x, y, z in zip(xs, ys, zs)])
+    assert expected.any()
+
+    # 单点查询
+    assert [fog_index.in_fog(x, y, z) for x, y, z in zip(xs.tolist(), ys.tolist(), zs.tolist())] == \
+        expected.tolist()
+    # 批量查询
+    assert (fog_index.in_fog_many(xs, ys, zs) == expected).all()
+    # 路径查询返回处于雾区的坐标序号
+    path = [map_info.coords.get(x, y, z) for x, y, z in zip(xs[:500], ys[:500], zs[:500])
+            if 0 <= x <= r.x and 0 <= y <= r.y and 0 <= z <= r.z]
+    assert fog_index.path_in_fog(path) == \
+        [i for i, c in enumerate(path) if _in_fog_linear(map_info.fogs, c.x, c.y, c.z)]
+
+    # 全体无人机的雾区判断
+    agents = {}
+    for no in range(50):
+        i = rng.randint(len(xs))
+        x, y, z = min(max(xs[i], 0), r.x), min(max(ys[i], 0), r.y), min(max(zs[i], 0), r.z)
+        agents[no] = Agent(UAV(no, int(x), int(y), int(z), remain_electricity=0), map_info)
+    env.fleet.sync(agents)
+    assert env.fleet.in_fog(fog_index).tolist() == \
+        [_in_fog_linear(map_info.fogs, a.uav.loc.x, a.uav.loc.y, a.uav.loc.z) for a in agents.values()]
+    env.fleet.sync({})
+    print("Point, path and batch queries agree.\n")
+
+
+def _test_attack_in_fog():
+    print("Testing attack end while the enemy is in fog...")
+
+    map_info = _map_info()
+    x1, y1, x2, y2, z1, z2 = map_info.fogs[0]
+    fog_loc = (x1, y1, z1)
+    clear = next((x, y, 0) for x in range(map_info.map_range.x + 1) for y in range(map_info.map_range.y + 1)
+                 if not map_info.fog_index.in_fog(x, y, 0))
+
+    def _attack(enemy):
+        """己方无人机攻击1号敌方无人机，返回attack_enemy之后的任务类型"""
+        agent = Agent(UAV(0, 0, 0, 0, remain_electricity=0), map_info)
+        agent.task_type = TaskType.ATTACK_ENEMY
+        env.agents.clear()
+        env.agents[0] = agent
+        env.attackerToEnemy.clear()
+        env.attackerToEnemy[0] = 1
+        env.fleet.sync(env.agents)
+        uav_enemy = {1: enemy} if enemy is not None else {}
+        attack_enemy(map_info, StepInfo(token=None, notice=None, match_status=0, time=1, uav_we={}, we_value=0,
+                                        uav_enemy=uav_enemy, enemy_value=0, goods={}))
+        return agent.task_type
+
+    # 雾区中的敌方无人机不携带货物的信息不可靠，继续攻击
+    assert _attack(UAV(1, *fog_loc, goods_no=-1, status=UAVStatus.IN_FOG)) == TaskType.ATTACK_ENEMY
+    assert _attack(UAV(1, *fog_loc, goods_no=-1, status=UAVStatus.NORMAL)) == TaskType.ATTACK_ENEMY
+    # 雾区外放下货物、坠毁或者消失的敌方无人机，攻击结束
+    assert _attack(UAV(1, *clear, goods_no=-1, status=UAVStatus.NORMAL)) == TaskType.NO_TASK
+    assert _attack(UAV(1, *fog_loc, goods_no=-1, status=UAVStatus.CRASHED)) == TaskType.NO_TASK
+    assert _attack(None) == TaskType.NO_TASK
+    env.agents.clear()
+    env.attackerToEnemy.clear()
+    env.fleet.sync(env.agents)
+    print("Attack continues in fog and ends outside it.\n")
+
+
+if __name__ == '__main__':
+    _test_fog_index()
+    _test_attack_in_fog()
@@ -1,19 +1,30 @@
 import sys
 import logging
 
+from recorder import MatchReader, RecordKind
+
 TIME = 0.5
 
 
+def _plan_times(fn):
+    """读取每一步的规划时间，支持文本日志和二进制比赛记录(.hkm)"""
+    if fn.endswith('.hkm'):
+        with MatchReader(fn) as reader:
+            for i in reader.find(RecordKind.SEND):
+                yield reader[i][2]
+    else:
+        with open(fn) as f:
+            for line in f.readlines():
+                yield float(line.split(' ')[-2])
+
+
 def main():
     fn = sys.argv[1]
     MT = 0
-    with open(fn) as f:
-        lines = f.readlines()
-        for line in lines:
-            t = float(line.split(' ')[-2])
-            MT = max(t, MT)
-            if float(t) > TIME:
-                logging.warning('TLE.')
+    for t in _plan_times(fn):
+        MT = max(t, MT)
+        if float(t) > TIME:
+            logging.warning('TLE.')
     logging.warning('max time: {}'.format(MT))
 
 
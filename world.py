@@ -0,0 +1,126 @@
+from codec import StepDecoder, loads
+from model import MapInfo, StepInfo
+
+
+class WorldState:
+    """
+    持久化的对战状态。按无人机编号和货物编号保存对象，每一步服务器下发的消息作为增量更新：
+    已有对象原地修改，只为新出现的编号创建对象，消失的编号从字典中移除。
+    每次更新后记录发生变化的编号集合，供后续流程跳过未变化的对象。
+    新对象由codec.StepDecoder构造，与整帧解码的结果相同。
+    """
+
+    def __init__(self, map_info: MapInfo):
+        self.map_info = map_info
+        self.decoder = StepDecoder(map_info)
+
+        # 始终返回同一个StepInfo对象，其中的字典和对象在每一步原地更新
+        self.step_info = StepInfo(token=None, notice=None, match_status=0, time=0,
+                                  uav_we={}, we_value=0, uav_enemy={}, enemy_value=0, goods={})
+
+        # 本步新增、变化(包括新增)和移除的编号
+        self.new_uav_we, self.changed_uav_we, self.removed_uav_we = set(), set(), set()
+        self.new_uav_enemy, self.changed_uav_enemy, self.removed_uav_enemy = set(), set(), set()
+        self.new_goods, self.changed_goods, self.removed_goods = set(), set(), set()
+
+    def _update_uavs(self, uavs: dict, uav_list: list, new: set, changed: set, removed: set):
+        decode_uav = self.decoder.uav
+        new.clear()
+        changed.clear()
+        removed.clear()
+
+        for u in uav_list:
+            no = u['no']
+            uav = uavs.get(no)
+            if uav is None:
+                uavs[no] = decode_uav(u)
+                new.add(no)
+                changed.add(no)
+                continue
+
+            dirty = False
+            x, y, z = u['x'], u['y'], u['z']
+            loc = uav.loc
+            if loc.x != x or loc.y != y or loc.z != z:
+                # Coordinate是不可变对象，使用坐标驻留表中的共享对象
+                uav.loc = self.map_info.coords.get(x, y, z)
+                dirty = True
+            if uav.goods_no != u['goods_no']:
+                uav.goods_no = u['goods_no']
+                dirty = True
+            if uav.status != u['status']:
+                uav.status = u['status']
+                dirty = True
+            if uav.remain_electricity != u['remain_electricity']:
+                uav.remain_electricity = u['remain_electricity']
+                dirty = True
+            if dirty:
+                changed.add(no)
+
+        if len(uavs) > len(uav_list):
+            # 存在本步消息中没有出现的无人机
+            present = {u['no'] for u in uav_list}
+            for no in [no for no in uavs if no not in present]:
+                uavs.pop(no)
+                removed.add(no)
+
+    def _update_goods(self, goods_list: list):
+        goods = self.step_info.goods
+        new, changed, removed = self.new_goods, self.changed_goods, self.removed_goods
+        decode_goods = self.decoder.goods
+        new.clear()
+        changed.clear()
+        removed.clear()
+
+        for g in goods_list:
+            no = g['no']
+            goods_obj = goods.get(no)
+            if goods_obj is None:
+                goods[no] = decode_goods(g)
+                new.add(no)
+                changed.add(no)
+                continue
+
+            if goods_obj.left_time != g['left_time'] or \
+                    goods_obj.remain_time != g['remain_time'] or \
+                    goods_obj.state != g['status']:
+                goods_obj.left_time = g['left_time']
+                goods_obj.remain_time = g['remain_time']
+                goods_obj.state = g['status']
+                changed.add(no)
+
+        if len(goods) > len(goods_list):
+            # 已经消失或送到的货物
+            present = {g['no'] for g in goods_list}
+            for no in [no for no in goods if no not in present]:
+                goods.pop(no)
+                removed.add(no)
+
+    def apply(self, data_dict):
+        """
+        把一步的对战信息应用到当前状态
+        :param data_dict: 已经解析的对战信息字典
+        :return: 更新后的StepInfo，每次调用返回同一个对象
+        """
+        step_info = self.step_info
+        step_info.token = data_dict['token']
+        step_info.notice = data_dict['notice']
+        step_info.match_status = data_dict['match_status']
+        step_info.time = data_dict['time']
+        step_info.we_value = data_dict['we_value']
+        step_info.enemy_value = data_dict['enemy_value']
+
+        self._update_uavs(step_info.uav_we, data_dict['UAV_we'],
+                          self.new_uav_we, self.changed_uav_we, self.removed_uav_we)
+        self._update_uavs(step_info.uav_enemy, data_dict['UAV_enemy'],
+                          self.new_uav_enemy, self.changed_uav_enemy, self.removed_uav_enemy)
+        self._update_goods(data_dict['goods'])
+
+        step_info.changed_uav_we = self.changed_uav_we
+        step_info.changed_uav_enemy = self.changed_uav_enemy
+        step_info.changed_goods = self.changed_goods
+        return step_info
+
+    def apply_frame(self, frame):
+        """由原始消息帧更新当前状态"""
+        return self.apply(loads(frame))